@@ -0,0 +1,286 @@
+"""
+Test benches of the link test: switches, M720 modules and the NetPing relay of each bench.
+
+The bench of the running test is kept in a context variable, so the benches from
+a bench file run concurrently in threads of one process (link_test_m720.py --benches).
+The bench file is JSON: {"benches": [{"name": ..., "test": ..., "m720_type": ..., ...}]},
+the keys are the Bench parameters, a missing key is taken from the default bench.
+"""
+import contextvars
+import functools
+import json
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+# Tests that can be run by the scheduler (manual test needs the operator)
+SCHEDULED_TESTS = ("reboot", "shutdown", "power1", "power2", "power3")
+M720_TYPES = ("optic", "copper")
+
+
+# ------------ M720 INVENTORY ----------------
+class M720Inventory:
+    """
+    Index of M720 serial numbers, IP addresses and switch interfaces.
+    """
+
+    # Categories written in the "new" (optic) or "copper" (copper) result columns
+    FIRST_CATEGORIES = ("new", "copper")
+
+    def __init__(self, sn_ip_dicts, switch1_m720, switch2_m720):
+        """
+        :param sn_ip_dicts: dictionary M720 type -> SN_IP_DICT_OPTIC or SN_IP_DICT_RJ_45
+        :param switch1_m720: dictionary serial number -> switch1 interface (port b)
+        :param switch2_m720: dictionary serial number -> switch2 interface (port a)
+        """
+        self._by_ip = {}
+        self._by_sn = {}
+        self._category = {}
+        for m720_type, sn_ip_dict in sn_ip_dicts.items():
+            for category, sn_ip in sn_ip_dict.items():
+                for serial_number, ip_address in sn_ip.items():
+                    self._by_ip.setdefault(ip_address, (serial_number, category))
+                    self._category.setdefault(serial_number, category)
+                    self._by_sn.setdefault((m720_type, serial_number), (
+                        ip_address, switch1_m720.get(serial_number),
+                        switch2_m720.get(serial_number)
+                    ))
+
+    def by_ip(self, ip_address):
+        """
+        :param ip_address: M720 IP address
+        :return: serial number and category (new, old, copper, optic), (None, None) if unknown
+        """
+        return self._by_ip.get(ip_address, (None, None))
+
+    def by_sn(self, serial_number, m720_type):
+        """
+        :param serial_number: M720 serial number
+        :param m720_type: optic or copper
+        :return: IP address, switch1 interface, switch2 interface, None if unknown
+        """
+        return self._by_sn.get((m720_type, serial_number))
+
+    def category(self, serial_number):
+        """
+        :param serial_number: M720 serial number
+        :return: category (new, old, copper, optic), None if unknown
+        """
+        return self._category.get(serial_number)
+
+    def serial_number(self, ip_address):
+        """
+        :param ip_address: M720 IP address
+        :return: serial number, 0 if unknown
+        """
+        serial_number, _ = self.by_ip(ip_address)
+        return 0 if serial_number is None else serial_number
+
+    def ip_list(self, sn_list, m720_type):
+        """
+        :param sn_list: M720 serial numbers
+        :param m720_type: optic or copper
+        :return: IP addresses of the known serial numbers in the same order
+        """
+        ip_list = []
+        for serial_number in sn_list:
+            entry = self.by_sn(serial_number, m720_type)
+            if entry is not None:
+                ip_list.append(entry[0])
+        return ip_list
+
+
+# ------------ BENCH ----------------
+class Bench:
+    """
+    One test bench: switch1 (port b), switch2 (port a), the M720 and the NetPing relay.
+    """
+
+    FIELDS = ("name", "switch1", "switch1_m720", "sn_ip", "net_ping_base_url", "relay_number",
+              "host_data", "switch2", "switch2_m720", "test", "m720_type", "recovery",
+              "hours", "minutes", "m720_login", "iterations")
+
+    def __init__(self, name, switch1, switch1_m720, sn_ip, net_ping_base_url, relay_number,
+                 host_data, switch2=None, switch2_m720=None, test=None, m720_type=None,
+                 recovery=False, hours=1, minutes=0, m720_login=None, iterations=None):
+        """
+        :param name: bench name used in the result file names, e.g. 24fx_copper
+        :param switch1: data to connect to the switch1 (port b M720) with SSH
+        :param switch1_m720: dictionary serial number -> switch1 interface
+        :param sn_ip: dictionary M720 type -> category -> serial number -> IP address
+        :param net_ping_base_url: http://<login>:<password>@<ip-address>:<udp-port>
+        :param relay_number: NetPing relay of the switch or list of relays power cycled together
+        :param host_data: data for copying the clocks results to the host device
+        :param switch2: data to connect to the switch2 (port a M720) with SSH
+        :param switch2_m720: dictionary serial number -> switch2 interface
+        :param test: reboot, shutdown, power1, power2 or power3 (run by the scheduler)
+        :param m720_type: optic or copper
+        :param recovery: measure the recovery time of each M720
+        :param hours: test time
+        :param minutes: test time
+        :param m720_login: data to connect to the M720 with SSH without the IP address
+        :param iterations: number of iterations, None - as many as fit in the test time
+        """
+        self.name = name
+        self.switch1 = switch1
+        self.switch1_m720 = switch1_m720
+        self.sn_ip = sn_ip
+        self.net_ping_base_url = net_ping_base_url
+        self.relay_number = relay_number
+        self.host_data = host_data
+        self.switch2 = switch2
+        self.switch2_m720 = switch2_m720 or {}
+        self.test = test
+        self.m720_type = m720_type
+        self.recovery = recovery
+        self.hours = hours
+        self.minutes = minutes
+        self.m720_login = m720_login or {}
+        self.iterations = iterations
+        self.inventory = M720Inventory(sn_ip, switch1_m720, self.switch2_m720)
+
+    @property
+    def relays(self):
+        """
+        :return: list of the NetPing relays of the bench
+        """
+        if isinstance(self.relay_number, (list, tuple)):
+            return list(self.relay_number)
+        return [self.relay_number]
+
+    @classmethod
+    def from_dict(cls, data, default=None):
+        """
+        Create the bench from the bench file entry.
+        :param data: dictionary with the Bench parameters, serial numbers may be strings
+        :param default: Bench with the values of the missing parameters
+        :return: Bench
+        """
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown bench parameters: {', '.join(sorted(unknown))}")
+        values = {field: getattr(default, field) for field in cls.FIELDS} if default else {}
+        values.update(data)
+        for field in ("switch1_m720", "switch2_m720"):
+            values[field] = {int(sn): intf for sn, intf in (values.get(field) or {}).items()}
+        values["sn_ip"] = {
+            m720_type: {category: {int(sn): ip for sn, ip in sn_ip.items()}
+                        for category, sn_ip in categories.items()}
+            for m720_type, categories in values.get("sn_ip", {}).items()
+        }
+        host_data = dict(default.host_data) if default else {}
+        host_data.update(data.get("host_data", {}))
+        if "host_path" not in data.get("host_data", {}) and "host_path" in host_data:
+            # The default path ends with the default bench name
+            host_data["host_path"] = Path(host_data["host_path"]).parent / values["name"]
+        if "host_path" in host_data:
+            host_data["host_path"] = Path(host_data["host_path"])
+        values["host_data"] = host_data
+        return cls(**values)
+
+
+def read_bench_definitions(file_name):
+    """
+    :param file_name: JSON file {"benches": [...]}
+    :return: list of bench definitions (dictionaries)
+    """
+    with open(file_name, "r", encoding="UTF-8") as file:
+        return json.load(file)["benches"]
+
+
+def load_benches(file_name, default=None):
+    """
+    Read and check the bench file.
+    :param file_name: JSON file {"benches": [...]}
+    :param default: Bench with the values of the missing parameters
+    :return: list of Bench
+    """
+    return benches_from_definitions(read_bench_definitions(file_name), default)
+
+
+def benches_from_definitions(definitions, default=None):
+    """
+    Create and check the benches.
+    :param definitions: list of bench definitions (dictionaries)
+    :param default: Bench with the values of the missing parameters
+    :return: list of Bench
+    """
+    benches = []
+    for number, data in enumerate(definitions, 1):
+        try:
+            bench = Bench.from_dict(data, default)
+        except (TypeError, ValueError, AttributeError) as error:
+            raise ValueError(f"Bench {number}: {error}") from error
+        if not re.fullmatch(r"\w+", str(bench.name)):
+            raise ValueError(f"Bench {number}: name must contain only letters, digits and _")
+        if bench.test not in SCHEDULED_TESTS:
+            raise ValueError(f"Bench {bench.name}: test must be one of {SCHEDULED_TESTS}")
+        if bench.m720_type not in M720_TYPES:
+            raise ValueError(f"Bench {bench.name}: m720_type must be one of {M720_TYPES}")
+        if bench.iterations is not None and (not isinstance(bench.iterations, int)
+                                             or bench.iterations < 1):
+            raise ValueError(f"Bench {bench.name}: iterations must be a positive integer")
+        if not (bench.hours or bench.minutes or bench.iterations):
+            raise ValueError(f"Bench {bench.name}: needs hours, minutes or iterations")
+        if bench.test in ("power2", "power3") and not (bench.switch2 and bench.switch2_m720):
+            raise ValueError(f"Bench {bench.name}: {bench.test} needs switch2 and switch2_m720")
+        benches.append(bench)
+
+    names = [bench.name for bench in benches]
+    switches = [bench.switch1["ip"] for bench in benches]
+    for values, what in ((names, "name"), (switches, "switch1 ip")):
+        duplicates = {value for value in values if values.count(value) > 1}
+        if duplicates:
+            raise ValueError(f"Benches with the same {what}: {', '.join(map(str, duplicates))}")
+    return benches
+
+
+# ------------ CURRENT BENCH ----------------
+_CURRENT_BENCH = contextvars.ContextVar("bench")
+_default_bench = None
+
+
+def set_default_bench(bench):
+    """
+    :param bench: Bench used outside of use_bench (the bench defined by the script globals)
+    """
+    global _default_bench
+    _default_bench = bench
+
+
+def current_bench():
+    """
+    :return: Bench of the running test
+    """
+    return _CURRENT_BENCH.get(_default_bench)
+
+
+@contextmanager
+def use_bench(bench):
+    """
+    Run the code in the with block on the bench.
+    :param bench: Bench
+    """
+    token = _CURRENT_BENCH.set(bench)
+    try:
+        yield bench
+    finally:
+        _CURRENT_BENCH.reset(token)
+
+
+def bench_task(function):
+    """
+    Bind the function to the current bench, e.g. before it is submitted to a worker thread.
+    The other context variables of the caller (e.g. the iteration timed by phase_timing)
+    are passed to the function too.
+    :param function: function
+    :return: function running on the bench of the caller
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def task(*args, **kwargs):
+        # A context can't be entered by several threads at once, each call runs in a copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return task
@@ -0,0 +1,238 @@
+"""
+Benchmark of the link test harness against the simulated bench (simulator.py).
+
+Measures the time of our own tooling in an iteration at 24, 96 and 480 modules:
+ssh_connect - SSHParamiko connection, authentication and su on the M720;
+shell_command - clk_ctl.py -t 1 in an open M720 session;
+ping - ping_ip_addresses of all M720;
+switch_status - check_link_on_switch of all interfaces in the persistent session;
+parse - parse_interface_status and down_interfaces of the switch output;
+get_results - ping results of all M720 for the results row;
+csv_write - write_iteration of one results row;
+total_results - create_total_results merge of the results file and the clock files.
+The per-phase percentiles and throughput are stored as a baseline JSON file,
+a later run is compared with it.
+"""
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+import click
+
+import link_test_m720
+from bench import benches_from_definitions, use_bench
+from simulator import LinkModel, Simulator
+from switch_output import down_interfaces, parse_interface_status
+
+SIZES = (24, 96, 480)
+PHASES = ("ssh_connect", "shell_command", "ping", "switch_status", "parse", "get_results",
+          "csv_write", "total_results")
+# Percentiles compared with the baseline
+COMPARED = ("p50", "p95")
+# Smaller increase is the noise of the sub-millisecond phases, in seconds
+MIN_DELTA = 0.001
+
+
+def _measure(function, repeat, *args, **kwargs):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def phase_stats(latencies, items=1):
+    """
+    :param latencies: latencies of the phase in seconds
+    :param items: number of modules (or rows) processed in one run of the phase
+    :return: dictionary count, p50, p95, p99, max in seconds and throughput in items/s
+    """
+    total = sum(latencies)
+    return {
+        "count": len(latencies),
+        "p50": link_test_m720.percentile(latencies, 50),
+        "p95": link_test_m720.percentile(latencies, 95),
+        "p99": link_test_m720.percentile(latencies, 99),
+        "max": max(latencies),
+        "throughput": items * len(latencies) / total if total else None,
+    }
+
+
+def _write_total_results_input(bench, iterations):
+    """
+    Create a results file with the iterations and the clock files of all M720.
+    :return: results file name
+    """
+    timestr = time.strftime("%d_%m_%H_%M")
+    sn_list = list(bench.switch1_m720)
+    results_filename = f"link_test_power_{bench.name}_{timestr}.csv"
+    rows = []
+    for number in range(1, iterations + 1):
+        down = [bench.switch1_m720[sn] for sn in sn_list if random.random() < 0.01]
+        rows.append([number, ", ".join(map(str, sn_list)), "", "", "", ", ".join(down)])
+    with open(results_filename, "w", encoding="UTF-8") as file:
+        file_writer = csv.writer(file, delimiter=";", lineterminator="\r")
+        file_writer.writerow(["Number of test", "Reachable copper s/n", "Unreachable copper s/n",
+                              "Reachable optic s/n", "Unreachable optic s/n",
+                              "Down interfaces (port B)"])
+        file_writer.writerows(rows)
+    for serial_number in sn_list:
+        with open(f"{serial_number}_test_clock_{timestr}.csv", "w", encoding="UTF-8") as file:
+            file_writer = csv.writer(file, delimiter=";", lineterminator="\r")
+            file_writer.writerow(["Number of test", "CNT 0", "CNT 1"])
+            file_writer.writerows([number, 1000000 + number, 1000001 + number]
+                                  for number in range(iterations + 1))
+    return results_filename
+
+
+def benchmark_size(modules, repeat=20, ssh_samples=10, iterations=1000, port=2222):
+    """
+    Run all phases against a simulated bench.
+    :param modules: number of M720
+    :param repeat: number of runs of each phase
+    :param ssh_samples: number of SSH connections measured
+    :param iterations: number of iterations in the results file merged by create_total_results
+    :param port: SSH port of the simulator
+    :return: dictionary phase -> phase_stats
+    """
+    simulator = Simulator(benches=1, modules=modules, port=port, netping_port=0,
+                          link_model=LinkModel(up_delay=(0, 0), seed=1))
+    results = {}
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(simulator)
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        current_directory = os.getcwd()
+        os.chdir(directory)
+        stack.callback(os.chdir, current_directory)
+        bench = benches_from_definitions(
+            simulator.bench_definitions(m720_type="copper", host_path=directory),
+            default=link_test_m720.DEFAULT_BENCH)[0]
+        stack.enter_context(use_bench(bench))
+        stack.callback(link_test_m720.SWITCH_SESSIONS.close_all)
+
+        ip_list = bench.inventory.ip_list(list(bench.switch1_m720), "copper")
+        intf_list = list(bench.switch1_m720.values())
+        m720_data = [{**bench.m720_login, "ip": ip} for ip in ip_list[:ssh_samples]]
+
+        latencies = []
+        for connection_data in m720_data:
+            start = time.perf_counter()
+            with link_test_m720.SSHParamiko(**connection_data):
+                latencies.append(time.perf_counter() - start)
+        results["ssh_connect"] = phase_stats(latencies)
+
+        with link_test_m720.SSHParamiko(**m720_data[0]) as ssh:
+            results["shell_command"] = phase_stats(
+                _measure(ssh.send_shell_commands, repeat, ["clk_ctl.py -t 1"]))
+
+        results["ping"] = phase_stats(
+            _measure(link_test_m720.ping_ip_addresses, repeat, ip_list), modules)
+
+        # The first call opens the persistent session
+        link_test_m720.check_link_on_switch(intf_list, bench.switch1)
+        results["switch_status"] = phase_stats(_measure(
+            link_test_m720.check_link_on_switch, repeat, intf_list, bench.switch1), modules)
+
+        output = simulator.benches[0][0][0].interface_status()
+        results["parse"] = phase_stats(_measure(
+            lambda: down_interfaces(parse_interface_status(output), intf_list), repeat * 10),
+            modules)
+
+        results["get_results"] = phase_stats(
+            _measure(link_test_m720.get_results, repeat, ip_list), modules)
+
+        columns, timestamps = link_test_m720.sample_iteration(ip_list, intf_list)
+        file_name = link_test_m720.create_file_with_results("link_test_bench", "copper")
+        latencies = []
+        for number in range(1, repeat * 10 + 1):
+            start = time.perf_counter()
+            link_test_m720.write_iteration(file_name, number, columns, timestamps)
+            latencies.append(time.perf_counter() - start)
+        results["csv_write"] = phase_stats(latencies)
+
+        results_filename = _write_total_results_input(bench, iterations)
+        results["total_results"] = phase_stats(_measure(
+            link_test_m720.create_total_results, max(repeat // 4, 1), list(bench.switch1_m720),
+            results_filename, "copper"), iterations)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_delta=MIN_DELTA):
+    """
+    Compare the results with the baseline.
+    :param results: dictionary modules -> phase -> phase_stats
+    :param baseline: baseline in the same format
+    :param tolerance: allowed relative increase of the percentiles
+    :param min_delta: allowed absolute increase of the percentiles in seconds
+    :return: list of (modules, phase, percentile, baseline value, value) of regressions
+    """
+    regressions = []
+    for modules, phases in results.items():
+        for phase, stats in phases.items():
+            base = baseline.get(str(modules), {}).get(phase)
+            if base is None:
+                continue
+            for key in COMPARED:
+                if stats[key] > max(base[key] * (1 + tolerance), base[key] + min_delta):
+                    regressions.append((modules, phase, key, base[key], stats[key]))
+    return regressions
+
+
+def _format_stats(modules, phase, stats):
+    throughput = "" if stats["throughput"] is None else f"{stats['throughput']:.1f}"
+    return (f"{modules:>7} {phase:<14} {stats['count']:>5} "
+            f"{stats['p50'] * 1000:>9.2f} {stats['p95'] * 1000:>9.2f} "
+            f"{stats['p99'] * 1000:>9.2f} {stats['max'] * 1000:>9.2f} {throughput:>12}")
+
+
+@click.command()
+@click.option('--modules', default=",".join(map(str, SIZES)),
+              help="Numbers of modules separated by commas.")
+@click.option('--repeat', type=int, default=20, help="Number of runs of each phase.")
+@click.option('--ssh-samples', type=int, default=10, help="Number of SSH connections measured.")
+@click.option('--iterations', type=int, default=1000,
+              help="Iterations in the file merged by create_total_results.")
+@click.option('--port', type=int, default=2222, help="SSH port of the simulator.")
+@click.option('--save', type=click.Path(), help="Save the results as the baseline JSON file.")
+@click.option('--baseline', type=click.Path(exists=True),
+              help="Compare the results with the baseline JSON file.")
+@click.option('--tolerance', type=float, default=0.2,
+              help="Allowed relative increase of p50 and p95 compared with the baseline.")
+def main(modules, repeat, ssh_samples, iterations, port, save, baseline, tolerance):
+    """
+    Benchmark of the link test harness at 24/96/480 simulated modules.
+    """
+    results = {}
+    click.echo(f"{'modules':>7} {'phase':<14} {'count':>5} {'p50 ms':>9} {'p95 ms':>9} "
+               f"{'p99 ms':>9} {'max ms':>9} {'items/s':>12}")
+    for size in (int(value) for value in modules.split(",")):
+        results[size] = benchmark_size(size, repeat, ssh_samples, iterations, port)
+        for phase in PHASES:
+            click.echo(_format_stats(size, phase, results[size][phase]))
+
+    if save:
+        with open(save, "w", encoding="UTF-8") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "results": {str(size): phases for size, phases in results.items()}},
+                      file, indent=2)
+        click.echo(f"Baseline saved to {save}")
+    if baseline:
+        with open(baseline, "r", encoding="UTF-8") as file:
+            regressions = compare(results, json.load(file)["results"], tolerance)
+        for size, phase, key, base_value, value in regressions:
+            click.echo(f"Regression at {size} modules, {phase} {key}: "
+                       f"{base_value * 1000:.2f} ms -> {value * 1000:.2f} ms")
+        if regressions:
+            raise SystemExit(1)
+        click.echo(f"No regressions compared with {baseline}")
+
+
+if __name__ == "__main__":
+    main()
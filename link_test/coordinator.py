@@ -0,0 +1,557 @@
+"""
+Coordinator and workers of the link test on several lab hosts.
+
+The coordinator hands the benches of a bench file (see bench.py) to the workers as jobs
+and writes the results of all workers to one result store. A worker runs link_test_m720
+on its host and streams the runs and the observations of each iteration back.
+
+Protocol (JSON over HTTP):
+POST /jobs/next {"worker"} -> {"id", "bench"}, {"retry": seconds} if the remaining jobs
+are running on other workers or 204 if there are no more jobs
+POST /jobs/<id>/heartbeat {"worker"} -> 409 if the job is no longer leased to the worker
+POST /runs {"job", "key", "test", "switch", "m720_type", "porta"} -> {"run_id"}
+POST /runs/<run id>/finish
+POST /observations {"job", "rows": [[run id, iteration, serial number, ...], ...]}
+POST /jobs/<id>/done {"worker", "result"}
+GET /status -> jobs with their worker, state, number of observations and result
+A request with an unknown job id gets 404.
+
+A job is leased to its worker for JOB_LEASE seconds, the worker renews the lease with
+heartbeats. The job of a worker that stopped sending them is handed to another worker,
+after JOB_ATTEMPTS leases it fails. A worker that lost the lease (409) aborts the test
+before the next iteration and does not report its result.
+The bench definitions contain the switch and M720 passwords: the coordinator listens
+on 127.0.0.1 by default, on another address it requires the shared token
+(Authorization: Bearer <token>) in every request.
+The requests are retried by the workers: a run is created once for its key and
+the observations of an iteration already stored are ignored.
+"""
+import hmac
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+import requests
+
+import link_test_m720
+from bench import Bench, benches_from_definitions, read_bench_definitions
+from result_store import ResultStore
+
+COORDINATOR_PORT = 8720
+COORDINATOR_HOST = "127.0.0.1"
+# Lease of a job without heartbeat in seconds
+JOB_LEASE = 120
+# Number of leases of a job before it fails (the job crashes its workers)
+JOB_ATTEMPTS = 3
+
+
+# ------------ COORDINATOR ----------------
+class UnknownJob(LookupError):
+    """
+    The request names a job that the coordinator does not have.
+    """
+
+
+class Coordinator:
+    """
+    Queue of the jobs (one job per bench) and the merged result store.
+    """
+
+    def __init__(self, definitions, store, lease=JOB_LEASE, attempts=JOB_ATTEMPTS):
+        """
+        :param definitions: list of bench definitions, checked before the start
+        :param store: ResultStore for the results of all workers
+        :param lease: lease of a job without heartbeat in seconds
+        :param attempts: number of leases of a job before it fails
+        """
+        benches = benches_from_definitions(definitions, default=link_test_m720.DEFAULT_BENCH)
+        self.store = store
+        self.lease = lease
+        self.attempts = attempts
+        self.jobs = [{"id": number, "bench": definition, "name": bench.name,
+                      "worker": None, "state": "pending", "attempts": 0, "observations": 0,
+                      "result": None}
+                     for number, (definition, bench) in enumerate(zip(definitions, benches), 1)]
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        # job id -> monotonic time when the lease of the running job expires
+        self._leases = {}
+        # (job id, key) -> run id, (job id, run id, iteration) of the stored observations
+        self._runs = {}
+        self._stored = set()
+        if not self.jobs:
+            self.finished.set()
+
+    def _job(self, job_id):
+        if not 1 <= job_id <= len(self.jobs):
+            raise UnknownJob(f"No job {job_id}")
+        return self.jobs[job_id - 1]
+
+    def _check_finished(self):
+        if all(job["state"] in ("done", "failed") for job in self.jobs):
+            self.finished.set()
+
+    def expire_leases(self):
+        """
+        Hand the running jobs without heartbeat to the next worker.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for job in self.jobs:
+                if job["state"] != "running" or self._leases[job["id"]] > now:
+                    continue
+                del self._leases[job["id"]]
+                if job["attempts"] >= self.attempts:
+                    job["state"] = "failed"
+                    logging.error(f"Job {job['id']} ({job['name']}) failed: no heartbeat "
+                                  f"from {job['worker']}, {job['attempts']} attempts")
+                else:
+                    job["state"] = "pending"
+                    logging.warning(f"Job {job['id']} ({job['name']}): no heartbeat from "
+                                    f"{job['worker']}, the job is queued again")
+            self._check_finished()
+
+    def next_job(self, worker):
+        """
+        :param worker: worker name
+        :return: the next pending job, {"retry": seconds} if the other jobs are running
+        or None if all jobs are finished
+        """
+        self.expire_leases()
+        with self._lock:
+            for job in self.jobs:
+                if job["state"] == "pending":
+                    job["state"] = "running"
+                    job["worker"] = worker
+                    job["attempts"] += 1
+                    self._leases[job["id"]] = time.monotonic() + self.lease
+                    logging.info(f"Job {job['id']} ({job['name']}) -> {worker}")
+                    return {"id": job["id"], "bench": job["bench"]}
+            if any(job["state"] == "running" for job in self.jobs):
+                # A running job is queued again if its worker stops
+                return {"retry": self.lease / 4}
+        return None
+
+    def heartbeat(self, job_id, worker):
+        """
+        Renew the lease of the job.
+        :param job_id: job id
+        :param worker: worker name
+        :return: False if the job is no longer leased to the worker
+        :raise UnknownJob: if there is no such job
+        """
+        with self._lock:
+            job = self._job(job_id)
+            if job["state"] != "running" or job["worker"] != worker:
+                return False
+            self._leases[job_id] = time.monotonic() + self.lease
+            return True
+
+    def start_run(self, job_id, test, switch, m720_type, porta, key=None):
+        """
+        :param job_id: job id
+        :param key: key of the run given by the worker, the run of a repeated request is
+        created once
+        :return: run id in the merged store
+        """
+        with self._lock:
+            self._job(job_id)
+            if key is not None and (job_id, key) in self._runs:
+                return self._runs[(job_id, key)]
+            logging.info(f"Job {job_id}: {test} run on {switch} started")
+            run_id = self.store.start_run(test, switch, m720_type, porta=porta)
+            if key is not None:
+                self._runs[(job_id, key)] = run_id
+            return run_id
+
+    def finish_run(self, run_id):
+        """
+        :param run_id: run id in the merged store
+        """
+        self.store.finish_run(run_id)
+
+    def add_observations(self, job_id, rows):
+        """
+        :param job_id: job id
+        :param rows: observation rows with the run id of the merged store,
+        all rows of each iteration, an iteration sent again is ignored
+        """
+        with self._lock:
+            job = self._job(job_id)
+            iterations = {(job_id, row[0], row[1]) for row in rows} - self._stored
+            new_rows = [tuple(row) for row in rows if (job_id, row[0], row[1]) in iterations]
+            self._stored.update(iterations)
+            job["observations"] += len(new_rows)
+        self.store.add_observations(new_rows)
+
+    def job_done(self, job_id, result, worker=None):
+        """
+        :param job_id: job id
+        :param result: file name with results on the worker, None if the test failed
+        :param worker: worker name, the result of a worker that lost the lease is ignored
+        """
+        with self._lock:
+            job = self._job(job_id)
+            if job["state"] != "running" or (worker is not None and job["worker"] != worker):
+                logging.warning(f"Job {job_id} ({job['name']}): result of {worker} is ignored, "
+                                f"the job is {job['state']} on {job['worker']}")
+                return
+            self._leases.pop(job_id, None)
+            job["state"] = "done" if result else "failed"
+            job["result"] = result
+            logging.info(f"Job {job_id} ({job['name']}) {job['state']} on {job['worker']}")
+            self._check_finished()
+
+    def status(self):
+        """
+        :return: list of jobs without the bench definitions
+        """
+        with self._lock:
+            return [{key: value for key, value in job.items() if key != "bench"}
+                    for job in self.jobs]
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _authorized(self):
+        token = self.server.token
+        if token is None:
+            return True
+        header = self.headers.get("Authorization", "")
+        if hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+        self._reply(HTTPStatus.UNAUTHORIZED, {"error": "invalid token"})
+        return False
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._reply(HTTPStatus.OK, self.server.coordinator.status())
+        else:
+            self._reply(HTTPStatus.NOT_FOUND)
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self._authorized():
+                return
+            parts = self.path.strip("/").split("/")
+            if parts == ["jobs", "next"]:
+                job = coordinator.next_job(body.get("worker"))
+                if job is None:
+                    self._reply(HTTPStatus.NO_CONTENT)
+                else:
+                    self._reply(HTTPStatus.OK, job)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "heartbeat":
+                if coordinator.heartbeat(int(parts[1]), body.get("worker")):
+                    self._reply(HTTPStatus.OK, {})
+                else:
+                    self._reply(HTTPStatus.CONFLICT, {"error": "the job is not leased"})
+            elif parts == ["runs"]:
+                run_id = coordinator.start_run(body["job"], body["test"], body["switch"],
+                                               body["m720_type"], body["porta"], body.get("key"))
+                self._reply(HTTPStatus.OK, {"run_id": run_id})
+            elif len(parts) == 3 and parts[0] == "runs" and parts[2] == "finish":
+                coordinator.finish_run(int(parts[1]))
+                self._reply(HTTPStatus.OK, {})
+            elif parts == ["observations"]:
+                coordinator.add_observations(body["job"], body["rows"])
+                self._reply(HTTPStatus.OK, {})
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "done":
+                coordinator.job_done(int(parts[1]), body.get("result"), body.get("worker"))
+                self._reply(HTTPStatus.OK, {})
+            else:
+                self._reply(HTTPStatus.NOT_FOUND)
+        except UnknownJob as error:
+            self._reply(HTTPStatus.NOT_FOUND, {"error": str(error)})
+        except (ValueError, KeyError, IndexError) as error:
+            logging.error(f"Bad request {self.path}: {error}")
+            self._reply(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+def start_coordinator(coordinator, host=COORDINATOR_HOST, port=COORDINATOR_PORT, token=None):
+    """
+    Serve the coordinator in a background thread.
+    :param coordinator: Coordinator
+    :param host: listening address
+    :param port: TCP port, 0 - any free port
+    :param token: shared token of the workers, required if the host is not a loopback address
+    :return: ThreadingHTTPServer, server.server_address is the listening address
+    """
+    if token is None and not _is_loopback(host):
+        raise ValueError(f"The coordinator on {host} needs a token: the jobs contain passwords")
+    server = ThreadingHTTPServer((host, port), _CoordinatorHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    server.token = token
+    threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+    return server
+
+
+# ------------ WORKER ----------------
+class CoordinatorClient:
+    """
+    HTTP client of the coordinator.
+    """
+
+    def __init__(self, url, worker, token=None, retries=5, backoff=1):
+        """
+        :param url: coordinator URL, e.g. http://192.168.90.102:8720
+        :param worker: worker name
+        :param token: shared token of the coordinator
+        :param retries: number of attempts of each request
+        :param backoff: delay before the second attempt in seconds, doubled on each attempt
+        """
+        self.url = url.rstrip("/")
+        self.worker = worker
+        self.retries = retries
+        self.backoff = backoff
+        self._session = requests.Session()
+        if token is not None:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def post(self, path, body=None):
+        """
+        :param path: request path
+        :param body: JSON body
+        :return: JSON reply, None if there is no content
+        """
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self._session.post(f"{self.url}{path}", json=body or {}, timeout=30)
+                response.raise_for_status()
+                return response.json() if response.content else None
+            except requests.RequestException as error:
+                logging.error(f"Request {path} to the coordinator failed ({attempt}): {error}")
+                response = getattr(error, "response", None)
+                # The coordinator rejects the request: repeating it does not help
+                rejected = response is not None and response.status_code < 500
+                if attempt == self.retries or rejected:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+        return None
+
+    def next_job(self):
+        """
+        Wait for a job while the remaining jobs are running on other workers.
+        :return: job {"id", "bench"} or None if there are no more jobs
+        """
+        while True:
+            job = self.post("/jobs/next", {"worker": self.worker})
+            if job is None or "retry" not in job:
+                return job
+            time.sleep(job["retry"])
+
+    def heartbeat(self, job_id):
+        """
+        :param job_id: job id
+        :return: False if the job is no longer leased to this worker
+        """
+        try:
+            self.post(f"/jobs/{job_id}/heartbeat", {"worker": self.worker})
+        except requests.HTTPError as error:
+            if error.response is not None and error.response.status_code == HTTPStatus.CONFLICT:
+                return False
+            raise
+        return True
+
+    def job_done(self, job_id, result):
+        self.post(f"/jobs/{job_id}/done", {"worker": self.worker, "result": result})
+
+
+class RemoteResultStore:
+    """
+    Result store of one job that sends the runs and the observations to the coordinator.
+    It has the methods of ResultStore used by the tests.
+    """
+
+    def __init__(self, client, job_id):
+        """
+        :param client: CoordinatorClient
+        :param job_id: job id
+        """
+        self.client = client
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def start_run(self, test, switch=None, m720_type=None, porta=False):
+        # The run is created once if the request is repeated
+        reply = self.client.post("/runs", {"job": self.job_id, "key": uuid.uuid4().hex,
+                                           "test": test, "switch": switch,
+                                           "m720_type": m720_type, "porta": bool(porta)})
+        return reply["run_id"]
+
+    def add_observations(self, rows):
+        """
+        Send the observations of one iteration.
+        If the coordinator is unreachable, they are sent with the next iteration
+        (the coordinator ignores an iteration it has already stored).
+        :param rows: list of observation rows
+        """
+        with self._lock:
+            self._pending.extend(rows)
+            try:
+                self._send_pending()
+            except requests.RequestException:
+                logging.error(f"{len(self._pending)} observations are kept for the next send")
+
+    def _send_pending(self):
+        if self._pending:
+            self.client.post("/observations", {"job": self.job_id, "rows": self._pending})
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._send_pending()
+
+    def finish_run(self, run_id):
+        self.flush()
+        self.client.post(f"/runs/{run_id}/finish")
+
+
+def run_worker(url, worker=None, jobs=1, token=None, heartbeat=JOB_LEASE / 4):
+    """
+    Take jobs from the coordinator and run them until there are no more jobs.
+    :param url: coordinator URL
+    :param worker: worker name, the host name by default
+    :param jobs: number of jobs run concurrently
+    :param token: shared token of the coordinator
+    :param heartbeat: interval of the heartbeats of the running jobs in seconds
+    :return: dictionary job id -> file name with results
+    """
+    worker = worker or socket.gethostname()
+    client = CoordinatorClient(url, worker, token)
+    link_test_m720.configure_worker_pools(jobs)
+    results = {}
+
+    def heartbeats(job_id, stop, lost):
+        while not stop.wait(heartbeat):
+            try:
+                if not client.heartbeat(job_id):
+                    # The job is handed to another worker: the test is aborted
+                    logging.error(f"Job {job_id} is no longer leased to {worker}")
+                    lost.set()
+                    return
+            except requests.RequestException:
+                # Retried with the next heartbeat, the lease is longer than the interval
+                pass
+
+    def take_jobs():
+        while True:
+            job = client.next_job()
+            if job is None:
+                return
+            result = None
+            stop = threading.Event()
+            lost = threading.Event()
+            threading.Thread(target=heartbeats, args=(job["id"], stop, lost),
+                             name=f"heartbeat{job['id']}", daemon=True).start()
+            try:
+                bench = Bench.from_dict(job["bench"], default=link_test_m720.DEFAULT_BENCH)
+                result = link_test_m720.run_bench(bench, RemoteResultStore(client, job["id"]),
+                                                  abort=lost)
+            except Exception as error:  # the job fails, the worker takes the next one
+                logging.error(f"Job {job['id']} failed: {error}")
+            finally:
+                stop.set()
+            results[job["id"]] = result
+            if lost.is_set():
+                # The job belongs to another worker now, its result is not ours to report
+                logging.error(f"Job {job['id']} is aborted, the result is not reported")
+                continue
+            client.job_done(job["id"], result)
+
+    threads = [threading.Thread(target=take_jobs, name=f"job{number}")
+               for number in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    link_test_m720.SWITCH_SESSIONS.close_all()
+    return results
+
+
+@click.group()
+def main():
+    """
+    Run the link test benches on several lab hosts.
+    """
+
+
+@main.command()
+@click.argument('benches', type=click.Path(exists=True))
+@click.option('--host', default=COORDINATOR_HOST,
+              help="Listening address, another address than 127.0.0.1 needs --token.")
+@click.option('--port', type=int, default=COORDINATOR_PORT, help="Listening port.")
+@click.option('--token', envvar="LINK_TEST_TOKEN", help="Shared token of the workers.")
+@click.option('--lease', type=float, default=JOB_LEASE,
+              help="Lease of a job without heartbeat in seconds.")
+@click.option('--db', default=link_test_m720.RESULT_DB, help="Merged result store.")
+def serve(benches, host, port, token, lease, db):
+    """
+    Hand the benches of the BENCHES file to the workers and merge their results.
+    """
+    with ResultStore(db) as store:
+        coordinator = Coordinator(read_bench_definitions(benches), store, lease=lease)
+        try:
+            server = start_coordinator(coordinator, host, port, token)
+        except ValueError as error:
+            raise click.UsageError(str(error))
+        click.echo(f"Coordinator on {host}:{server.server_address[1]}, "
+                   f"{len(coordinator.jobs)} jobs")
+        # The jobs of the stopped workers are queued again also if no worker asks for a job
+        while not coordinator.finished.wait(lease / 4):
+            coordinator.expire_leases()
+        server.shutdown()
+        server.server_close()
+    for job in coordinator.status():
+        click.echo(f"{job['name']}: {job['state']} on {job['worker']}, "
+                   f"{job['observations']} observations, {job['result']}")
+
+
+@main.command()
+@click.argument('url')
+@click.option('--name', help="Worker name, the host name by default.")
+@click.option('--jobs', type=int, default=1, help="Number of benches run concurrently.")
+@click.option('--token', envvar="LINK_TEST_TOKEN", help="Shared token of the coordinator.")
+def work(url, name, jobs, token):
+    """
+    Run the jobs of the coordinator URL on this host.
+    """
+    for job_id, result in run_worker(url, name, jobs, token).items():
+        click.echo(f"Job {job_id}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Asynchronous ICMP echo prober for the M720 IP addresses.
+
+All targets are pinged from one socket: an unprivileged ICMP datagram socket
+(net.ipv4.ping_group_range) or a raw socket if the datagram socket is not allowed.
+Probing of a host stops at its first reply.
+"""
+import asyncio
+import itertools
+import random
+import socket
+import struct
+import time
+from collections import namedtuple
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Echo identifier of each probe: the probes running at the same time on raw sockets
+# (e.g. benches run in threads) receive the replies of each other
+_IDENTIFIERS = itertools.count(random.randrange(0x10000))
+
+# Statistics of one IP address, rtt in milliseconds (None if there was no reply)
+PingStats = namedtuple("PingStats", ["ip", "sent", "received", "loss", "rtt_min", "rtt_avg",
+                                     "rtt_max"])
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(identifier, sequence):
+    payload = struct.pack("!d", time.monotonic()) + b"m720-link-test"
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = _checksum(header + payload)
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence)
+    return header + payload
+
+
+def open_icmp_socket():
+    """
+    Open an unprivileged ICMP datagram socket, raw socket otherwise.
+    :return: socket and True if the socket is raw
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        raw = False
+    except PermissionError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        raw = True
+    sock.setblocking(False)
+    return sock, raw
+
+
+class IcmpProber:
+    """
+    Send ICMP echo requests to many hosts from one socket and match replies by id/seq.
+    """
+
+    def __init__(self, count=10, interval=1.0, timeout=1.0):
+        """
+        :param count: maximum number of echo requests for each host
+        :param interval: interval between echo requests to the same host in seconds
+        :param timeout: waiting time for replies after the last request in seconds
+        """
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+
+    async def probe(self, ip_list):
+        """
+        Ping the IP addresses.
+        :param ip_list: list of IP addresses
+        :return: dictionary IP address -> PingStats
+        """
+        loop = asyncio.get_running_loop()
+        sock, raw = open_icmp_socket()
+        identifier = next(_IDENTIFIERS) & 0xFFFF
+        sent = {ip: 0 for ip in ip_list}
+        rtts = {ip: [] for ip in ip_list}
+        in_flight = {}
+        waiting = set(ip_list)
+        all_replied = asyncio.Event()
+        if not waiting:
+            all_replied.set()
+
+        def on_readable():
+            while True:
+                try:
+                    packet, (address, _) = sock.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    return
+                if raw:
+                    packet = packet[(packet[0] & 0x0F) * 4:]
+                if len(packet) < 8:
+                    continue
+                icmp_type, _, _, reply_identifier, sequence = struct.unpack("!BBHHH",
+                                                                             packet[:8])
+                # The kernel replaces the id of a datagram socket with the local port
+                if icmp_type != ICMP_ECHO_REPLY or (raw and reply_identifier != identifier):
+                    continue
+                request = in_flight.get(sequence)
+                if request is None or request[0] != address:
+                    continue
+                del in_flight[sequence]
+                rtts[address].append((time.monotonic() - request[1]) * 1000)
+                waiting.discard(address)
+                if not waiting:
+                    all_replied.set()
+
+        loop.add_reader(sock.fileno(), on_readable)
+        sequence = 0
+        try:
+            for _ in range(self.count):
+                for ip in list(waiting):
+                    sequence = (sequence + 1) & 0xFFFF
+                    try:
+                        sock.sendto(_echo_request(identifier, sequence), (ip, 0))
+                    except OSError:
+                        # Host or network unreachable, the request is lost
+                        pass
+                    in_flight[sequence] = (ip, time.monotonic())
+                    sent[ip] += 1
+                if not waiting:
+                    break
+                try:
+                    await asyncio.wait_for(all_replied.wait(), self.interval)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            if waiting and self.timeout > self.interval:
+                try:
+                    await asyncio.wait_for(all_replied.wait(), self.timeout - self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            loop.remove_reader(sock.fileno())
+            sock.close()
+
+        results = {}
+        for ip in ip_list:
+            received = len(rtts[ip])
+            loss = 100 * (sent[ip] - received) / sent[ip] if sent[ip] else 100.0
+            if received:
+                results[ip] = PingStats(ip, sent[ip], received, max(loss, 0.0), min(rtts[ip]),
+                                        sum(rtts[ip]) / received, max(rtts[ip]))
+            else:
+                results[ip] = PingStats(ip, sent[ip], 0, 100.0, None, None, None)
+        return results
+
+
+def ping_stats(ip_list, count=10, interval=1.0, timeout=1.0):
+    """
+    Ping the IP addresses and return per-IP statistics.
+    :param ip_list: list of IP addresses
+    :param count: maximum number of echo requests for each host
+    :param interval: interval between echo requests in seconds
+    :param timeout: waiting time for replies after the last request in seconds
+    :return: dictionary IP address -> PingStats
+    """
+    prober = IcmpProber(count=count, interval=interval, timeout=timeout)
+    return asyncio.run(prober.probe(list(ip_list)))
+
+
+def ping_ip_addresses(ip_list, count=10, interval=1.0, timeout=1.0):
+    """
+    Ping M720 IP addresses from the list
+    :param ip_list: list of IP addresses
+    :param count: maximum number of echo requests for each host
+    :param interval: interval between echo requests in seconds
+    :param timeout: waiting time for replies after the last request in seconds
+    :return: two lists, pingable_ip containing IP addresses that were ping successfully,
+    unpingable_ip otherwise
+    """
+    stats = ping_stats(ip_list, count=count, interval=interval, timeout=timeout)
+    pingable_ip = [ip for ip in ip_list if stats[ip].received]
+    unpingable_ip = [ip for ip in ip_list if not stats[ip].received]
+    return pingable_ip, unpingable_ip
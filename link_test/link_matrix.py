@@ -0,0 +1,177 @@
+"""
+Pass/fail matrix of the link test: iterations x modules for ping, port B link and port A link.
+
+Each module and check is stored as a bitset (one bit per iteration, 1 - failure),
+the statistics are computed with bitwise operations on the whole bitset.
+"""
+import math
+
+CHECKS = ("ping", "port_b", "port_a")
+
+
+def _popcount(value):
+    return bin(value).count("1")
+
+
+def _longest_streak(value):
+    streak = 0
+    while value:
+        value &= value >> 1
+        streak += 1
+    return streak
+
+
+class LinkMatrix:
+    """
+    Iterations x modules pass/fail matrix.
+    """
+
+    def __init__(self, switch1_m720, switch2_m720=None):
+        """
+        :param switch1_m720: dictionary serial number -> switch1 interface (port b)
+        :param switch2_m720: dictionary serial number -> switch2 interface (port a)
+        """
+        self.serial_numbers = list(switch1_m720)
+        self.interfaces = {"port_b": dict(switch1_m720), "port_a": dict(switch2_m720 or {})}
+        self._sn_by_interface = {
+            check: {interface: serial_number for serial_number, interface in interfaces.items()}
+            for check, interfaces in self.interfaces.items()
+        }
+        self.iterations = 0
+        self._failures = {
+            check: {serial_number: bytearray() for serial_number in self.serial_numbers}
+            for check in CHECKS
+        }
+        self._checked = {check: False for check in CHECKS}
+        self._bitsets = None
+
+    def add_iteration(self, failed):
+        """
+        Add one iteration.
+        :param failed: dictionary check (ping, port_b, port_a) -> failed serial numbers,
+        a check without key is not checked in the test
+        """
+        index = self.iterations
+        byte, bit = index >> 3, 1 << (index & 7)
+        for check in CHECKS:
+            if check not in failed:
+                continue
+            self._checked[check] = True
+            rows = self._failures[check]
+            for serial_number in failed[check]:
+                row = rows.get(serial_number)
+                if row is None:
+                    continue
+                if len(row) <= byte:
+                    row.extend(bytes(byte - len(row) + 1))
+                row[byte] |= bit
+        self.iterations += 1
+        self._bitsets = None
+
+    def add_row(self, columns, porta=False):
+        """
+        Add one iteration from the columns of the results file.
+        :param columns: reachable new, unreachable new, reachable old, unreachable old,
+        (down interfaces port b), (down interfaces port a)
+        :param porta: True if the row has the port a column
+        """
+        failed = {"ping": set()}
+        for column in (columns[1], columns[3]):
+            if column:
+                failed["ping"].update(int(serial_number) for serial_number in column.split(", "))
+        ports = []
+        if len(columns) > 4:
+            ports.append(("port_b", columns[4]))
+        if porta:
+            ports.append(("port_a", columns[5]))
+        for check, column in ports:
+            sn_by_interface = self._sn_by_interface[check]
+            failed[check] = {sn_by_interface[interface]
+                             for interface in (column.split(", ") if column else [])
+                             if interface in sn_by_interface}
+        self.add_iteration(failed)
+
+    def bitsets(self, check):
+        """
+        :param check: ping, port_b or port_a
+        :return: dictionary serial number -> bitset of failures (bit i - iteration i)
+        """
+        if self._bitsets is None:
+            self._bitsets = {
+                name: {serial_number: int.from_bytes(row, "little")
+                       for serial_number, row in rows.items()}
+                for name, rows in self._failures.items()
+            }
+        return self._bitsets[check]
+
+    def checked(self, check):
+        """
+        :param check: ping, port_b or port_a
+        :return: True if the check was added at least once
+        """
+        return self._checked[check]
+
+    def failure_rate(self, check):
+        """
+        :param check: ping, port_b or port_a
+        :return: dictionary serial number -> failure rate (0 - 1)
+        """
+        if not self.iterations:
+            return {serial_number: 0.0 for serial_number in self.serial_numbers}
+        return {serial_number: _popcount(bitset) / self.iterations
+                for serial_number, bitset in self.bitsets(check).items()}
+
+    def longest_streak(self, check):
+        """
+        :param check: ping, port_b or port_a
+        :return: dictionary serial number -> longest number of consecutive failed iterations
+        """
+        return {serial_number: _longest_streak(bitset)
+                for serial_number, bitset in self.bitsets(check).items()}
+
+    def link_drops(self):
+        """
+        :return: dictionary serial number -> bitset of iterations with port b or port a down
+        """
+        port_b = self.bitsets("port_b")
+        port_a = self.bitsets("port_a")
+        return {serial_number: port_b[serial_number] | port_a[serial_number]
+                for serial_number in self.serial_numbers}
+
+    def correlation(self, first=None, second="ping"):
+        """
+        Phi coefficient between two failure series of each module.
+        :param first: check name or None for the link drops (port b or port a down)
+        :param second: check name
+        :return: dictionary serial number -> correlation (-1 - 1), None if a series is constant
+        """
+        first_bitsets = self.link_drops() if first is None else self.bitsets(first)
+        second_bitsets = self.bitsets(second)
+        total = self.iterations
+        result = {}
+        for serial_number in self.serial_numbers:
+            first_count = _popcount(first_bitsets[serial_number])
+            second_count = _popcount(second_bitsets[serial_number])
+            both = _popcount(first_bitsets[serial_number] & second_bitsets[serial_number])
+            denominator = (first_count * (total - first_count)
+                           * second_count * (total - second_count))
+            if not denominator:
+                result[serial_number] = None
+                continue
+            result[serial_number] = (total * both - first_count * second_count) / math.sqrt(
+                denominator)
+        return result
+
+    def hot_spots(self, check, top=10):
+        """
+        Interfaces with the most link failures.
+        :param check: port_b or port_a
+        :param top: number of interfaces
+        :return: list of (interface, serial number, failures) sorted by failures
+        """
+        interfaces = self.interfaces[check]
+        failures = [(interfaces[serial_number], serial_number, _popcount(bitset))
+                    for serial_number, bitset in self.bitsets(check).items()
+                    if serial_number in interfaces and bitset]
+        failures.sort(key=lambda item: item[2], reverse=True)
+        return failures[:top]
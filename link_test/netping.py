@@ -0,0 +1,135 @@
+"""
+Client of the NetPing relays (relay.cgi).
+
+relay.cgi?rN=s - set the relay operation mode (0 - manual off, 1 - manual on),
+the reply is relay_result('ok').
+relay.cgi?rN - read the relay, the reply is relay_result('ok', <mode>, <state>).
+Several relays are switched concurrently on a shared thread pool through one HTTP session,
+each command is confirmed by reading the relay state back.
+"""
+import logging
+import re
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+RELAY_OFF = 0
+RELAY_ON = 1
+
+RELAY_RESULT_REGEX = re.compile(r"relay_result\('(?P<result>\w+)'"
+                                r"(?:\s*,\s*(?P<mode>\d+))?(?:\s*,\s*(?P<state>\d+))?")
+
+
+class NetPingClient:
+    """
+    Relays of one NetPing with the latency of each command.
+    """
+
+    def __init__(self, base_url, session=None, executor=None, timeout=10, retries=3,
+                 verify_delay=0.2, max_latencies=10000):
+        """
+        :param base_url: http://<login>:<password>@<ip-address>:<udp-port>
+        :param session: requests.Session shared with other clients, a new session by default
+        :param executor: ThreadPoolExecutor shared with other work to switch the relays
+        concurrently, None - the relays are switched one after another
+        :param timeout: timeout of each HTTP request in seconds
+        :param retries: number of attempts to switch a relay
+        :param verify_delay: delay before the state is read back in seconds
+        :param max_latencies: number of the last latencies kept
+        """
+        self.base_url = base_url.rstrip("/")
+        # Address without the login and password for the log
+        self.host = urlsplit(self.base_url).hostname
+        self.session = session or requests.Session()
+        self.executor = executor
+        self.timeout = timeout
+        self.retries = retries
+        self.verify_delay = verify_delay
+        self.max_latencies = max_latencies
+        # (time, relay, mode, command latency in seconds, confirmed)
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def _get(self, query):
+        response = self.session.get(f"{self.base_url}/relay.cgi?{query}", timeout=self.timeout)
+        response.raise_for_status()
+        match = RELAY_RESULT_REGEX.search(response.text)
+        if match is None or match.group("result") != "ok":
+            raise ValueError(f"Unexpected reply to relay.cgi?{query}: {response.text.strip()}")
+        return match
+
+    def relay_state(self, relay):
+        """
+        :param relay: relay number
+        :return: state of the relay (0 - off, 1 - on)
+        """
+        match = self._get(f"r{relay}")
+        state = match.group("state") or match.group("mode")
+        if state is None:
+            raise ValueError(f"No state of relay {relay} in the reply")
+        return int(state)
+
+    def _switch(self, relay, mode):
+        for attempt in range(1, self.retries + 1):
+            start = time.monotonic()
+            try:
+                self._get(f"r{relay}={mode}")
+                latency = time.monotonic() - start
+                time.sleep(self.verify_delay)
+                confirmed = self.relay_state(relay) == mode
+            except (requests.RequestException, ValueError) as error:
+                logging.error(f"Relay {relay} of {self.host} ({attempt}): {error}")
+                continue
+            self._record(relay, mode, latency, confirmed)
+            if confirmed:
+                return True
+            logging.error(f"Relay {relay} of {self.host} is not switched to {mode} "
+                          f"({attempt})")
+        return False
+
+    def _record(self, relay, mode, latency, confirmed):
+        with self._lock:
+            self.latencies.append((time.time(), relay, mode, latency, confirmed))
+            del self.latencies[:-self.max_latencies]
+
+    def set_relays(self, modes):
+        """
+        Switch the relays concurrently and confirm their state.
+        :param modes: dictionary relay number -> mode (0 - manual off, 1 - manual on)
+        :return: dictionary relay number -> True if the state is confirmed
+        """
+        if self.executor is None or len(modes) < 2:
+            return {relay: self._switch(relay, mode) for relay, mode in modes.items()}
+        futures = {relay: self.executor.submit(self._switch, relay, mode)
+                   for relay, mode in modes.items()}
+        return {relay: future.result() for relay, future in futures.items()}
+
+    def power_cycle(self, relays, off_time):
+        """
+        Power off the relays, wait and power them on.
+        :param relays: relay numbers
+        :param off_time: time while the relays are off in seconds
+        :return: True if the power off and the power on of all relays are confirmed
+        """
+        switched_off = self.set_relays({relay: RELAY_OFF for relay in relays})
+        if all(switched_off.values()):
+            time.sleep(off_time)
+        # The relays are powered on even if the power off was not confirmed
+        switched_on = self.set_relays({relay: RELAY_ON for relay in relays})
+        return all(switched_off.values()) and all(switched_on.values())
+
+    def latency_stats(self):
+        """
+        :return: number of commands, min, median and max latency in seconds
+        (None if there were no commands) and number of not confirmed commands
+        """
+        with self._lock:
+            latencies = [latency for _, _, _, latency, _ in self.latencies]
+            not_confirmed = sum(1 for *_, confirmed in self.latencies if not confirmed)
+        if not latencies:
+            return 0, None, None, None, not_confirmed
+        return (len(latencies), min(latencies), statistics.median(latencies), max(latencies),
+                not_confirmed)
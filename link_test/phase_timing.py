@@ -0,0 +1,288 @@
+"""
+Time of the phases of each link test iteration.
+
+A phase (power off, boot wait, ping, SSH connection, shell command, ...) is timed with
+the phase() context manager. Inside an iteration (MetricsRecorder.iteration) its time is
+added to the iteration, outside of an iteration phase() does nothing.
+A phase started inside another phase is named <outer phase>/<phase>,
+e.g. boot_wait/ping or clock_collection/ssh_connect.
+The iteration is kept in a context variable: the tasks submitted with bench.bench_task
+to the worker threads add their phases to the iteration of the caller.
+
+Each iteration is written as one JSON line:
+{"bench", "test", "iteration", "counted", "start", "duration",
+ "phases": {phase: {"count", "seconds", "max"}}},
+"seconds" is the sum of the phase time in all threads, so phases run concurrently
+may take more than the iteration duration.
+The Prometheus text file (node_exporter textfile collector format) is rewritten
+after each iteration with the histograms of all phases and iterations.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_CURRENT_ITERATION = contextvars.ContextVar("iteration", default=None)
+_CURRENT_PHASE = contextvars.ContextVar("phase", default=None)
+
+
+def current_iteration():
+    """
+    :return: IterationTimer of the running iteration, None outside of an iteration
+    """
+    return _CURRENT_ITERATION.get()
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the time of the with block to the phase of the current iteration.
+    :param name: phase name
+    """
+    timer = _CURRENT_ITERATION.get()
+    if timer is None:
+        yield
+        return
+    parent = _CURRENT_PHASE.get()
+    name = f"{parent}/{name}" if parent else name
+    token = _CURRENT_PHASE.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+        _CURRENT_PHASE.reset(token)
+
+
+class IterationTimer:
+    """
+    Phases of one iteration.
+    The iteration is written when it is closed and all its background tasks are finished.
+    """
+
+    def __init__(self, recorder, number):
+        """
+        :param recorder: MetricsRecorder
+        :param number: number of test
+        """
+        self.recorder = recorder
+        self.number = number
+        # False if the iteration is repeated, e.g. the power cycle was not confirmed
+        self.counted = True
+        self.start = time.time()
+        self.duration = None
+        # phase -> list of durations in seconds
+        self.phases = {}
+        self._started = time.perf_counter()
+        self._holds = 0
+        self._closed = False
+        self._written = False
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        """
+        :param name: phase name
+        :param seconds: phase time
+        """
+        with self._lock:
+            self.phases.setdefault(name, []).append(seconds)
+
+    def background(self, function):
+        """
+        Keep the iteration open until the function is run, e.g. in the pipeline.
+        :param function: task of the iteration
+        :return: function that releases the iteration after it is run
+        """
+        with self._lock:
+            self._holds += 1
+
+        def task(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.release()
+
+        task.__name__ = getattr(function, "__name__", "task")
+        return task
+
+    def release(self):
+        """
+        Release the iteration held by background, also if the task is never run.
+        """
+        with self._lock:
+            self._holds -= 1
+        self._write_when_done()
+
+    def close(self):
+        """
+        End of the iteration in the test loop.
+        """
+        with self._lock:
+            self.duration = time.perf_counter() - self._started
+            self._closed = True
+        self._write_when_done()
+
+    def _write_when_done(self):
+        with self._lock:
+            if not self._closed or self._holds or self._written:
+                return
+            self._written = True
+        self.recorder.write(self)
+
+    def record(self):
+        """
+        :return: JSON record of the iteration
+        """
+        with self._lock:
+            phases = {name: {"count": len(values), "seconds": round(sum(values), 6),
+                             "max": round(max(values), 6)}
+                      for name, values in self.phases.items()}
+        return {**self.recorder.labels, "iteration": self.number, "counted": self.counted,
+                "start": round(self.start, 3), "duration": round(self.duration, 6),
+                "phases": phases}
+
+
+class _Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _labels(labels):
+    values = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        values.append(f'{key}="{value}"')
+    return "{" + ",".join(values) + "}"
+
+
+class MetricsRecorder:
+    """
+    JSON lines and Prometheus text file of the iterations of one test run.
+    """
+
+    def __init__(self, jsonl_file=None, prom_file=None, labels=None, buckets=BUCKETS):
+        """
+        :param jsonl_file: file with one JSON record per iteration, None - not written
+        :param prom_file: Prometheus text file, None - not written
+        :param labels: labels of all records and metrics, e.g. {"bench": ..., "test": ...}
+        :param buckets: histogram buckets in seconds
+        """
+        self.jsonl_file = jsonl_file
+        self.prom_file = prom_file
+        self.labels = dict(labels or {})
+        self.buckets = buckets
+        self.iterations = 0
+        self._phases = {}
+        self._iteration_histogram = _Histogram(buckets)
+        self._last_phases = {}
+        self._last_time = None
+        self._lock = threading.Lock()
+        self._file = open(jsonl_file, "a", encoding="UTF-8") if jsonl_file else None
+
+    @contextmanager
+    def iteration(self, number):
+        """
+        Time the phases of the iteration run in the with block.
+        :param number: number of test
+        :return: IterationTimer
+        """
+        timer = IterationTimer(self, number)
+        token = _CURRENT_ITERATION.set(timer)
+        try:
+            yield timer
+        finally:
+            _CURRENT_ITERATION.reset(token)
+            timer.close()
+
+    def write(self, timer):
+        """
+        Write the iteration to the JSON lines and update the Prometheus text file.
+        :param timer: closed IterationTimer
+        """
+        record = timer.record()
+        with self._lock:
+            if self._file:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+            self.iterations += 1
+            self._iteration_histogram.observe(record["duration"])
+            for name, values in timer.phases.items():
+                histogram = self._phases.setdefault(name, _Histogram(self.buckets))
+                for value in values:
+                    histogram.observe(value)
+            self._last_phases = {name: values["seconds"]
+                                 for name, values in record["phases"].items()}
+            self._last_time = record["start"]
+            if self.prom_file:
+                self._write_prom()
+
+    def _histogram_lines(self, metric, labels, histogram):
+        lines = []
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{metric}_bucket{_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{metric}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+        lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        return lines
+
+    def _write_prom(self):
+        lines = ["# HELP link_test_iterations_total Iterations of the link test.",
+                 "# TYPE link_test_iterations_total counter",
+                 f"link_test_iterations_total{_labels(self.labels)} {self.iterations}",
+                 "# HELP link_test_iteration_seconds Duration of the link test iterations.",
+                 "# TYPE link_test_iteration_seconds histogram"]
+        lines.extend(self._histogram_lines("link_test_iteration_seconds", self.labels,
+                                           self._iteration_histogram))
+        lines.extend(["# HELP link_test_phase_seconds Time of the phases of the iterations.",
+                      "# TYPE link_test_phase_seconds histogram"])
+        for name in sorted(self._phases):
+            lines.extend(self._histogram_lines("link_test_phase_seconds",
+                                               {**self.labels, "phase": name},
+                                               self._phases[name]))
+        lines.extend(["# HELP link_test_last_iteration_phase_seconds "
+                      "Time of the phases of the last iteration.",
+                      "# TYPE link_test_last_iteration_phase_seconds gauge"])
+        for name in sorted(self._last_phases):
+            lines.append(f"link_test_last_iteration_phase_seconds"
+                         f"{_labels({**self.labels, 'phase': name})} {self._last_phases[name]}")
+        lines.extend(["# HELP link_test_last_iteration_timestamp_seconds "
+                      "Start of the last iteration.",
+                      "# TYPE link_test_last_iteration_timestamp_seconds gauge",
+                      f"link_test_last_iteration_timestamp_seconds{_labels(self.labels)} "
+                      f"{self._last_time}"])
+        # The scraper must never read a half-written file
+        temporary = f"{self.prom_file}.tmp"
+        with open(temporary, "w", encoding="UTF-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.prom_file)
+
+    def close(self):
+        """
+        Close the JSON lines file.
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,262 @@
+"""
+SQLite store of the link test results.
+
+One row per (run, iteration, serial number, port) observation: "ping" - the M720 is pinged,
+"port_b"/"port_a" - the link of the M720 interface is up on switch1/switch2.
+"""
+import csv
+import sqlite3
+import threading
+import time
+
+import click
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    test TEXT NOT NULL,
+    switch TEXT,
+    m720_type TEXT,
+    porta INTEGER NOT NULL DEFAULT 0,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    iteration INTEGER NOT NULL,
+    serial_number INTEGER NOT NULL,
+    category TEXT,
+    port TEXT NOT NULL,
+    interface TEXT,
+    ok INTEGER NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_run ON observations (run_id, iteration);
+CREATE INDEX IF NOT EXISTS observations_sn ON observations (serial_number, port, run_id);
+CREATE INDEX IF NOT EXISTS observations_time ON observations (time);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+
+class ResultStore:
+    """
+    Results of the link tests written through one connection in batched transactions.
+    The queries use a connection of the calling thread (WAL: they don't wait for the writes).
+    """
+
+    def __init__(self, path, batch_size=500):
+        """
+        :param path: database file name
+        :param batch_size: number of observations written in one transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._local = threading.local()
+        self._readers = []
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Used by this thread only, closed by close() in any thread
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._readers.append(connection)
+        return connection
+
+    def start_run(self, test, switch=None, m720_type=None, porta=False):
+        """
+        :param test: test name (reboot, shutdown, power1, power2, power3, manual)
+        :param switch: switch name
+        :param m720_type: optic or copper
+        :param porta: True if port a is checked
+        :return: run id
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (test, switch, m720_type, porta, started) VALUES (?, ?, ?, ?, ?)",
+                (test, switch, m720_type, int(porta), time.time())
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """
+        Write pending observations and the finish time of the run.
+        :param run_id: run id
+        """
+        self.flush()
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE runs SET finished = ? WHERE id = ?",
+                                     (time.time(), run_id))
+
+    def add_observations(self, rows):
+        """
+        :param rows: list of (run id, iteration, serial number, category, port, interface,
+        ok, time)
+        """
+        with self._lock:
+            self._pending.extend(rows)
+            if len(self._pending) < self.batch_size:
+                return
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def flush(self):
+        """
+        Write pending observations.
+        """
+        with self._lock:
+            if self._pending:
+                self._write_pending()
+
+    def close(self):
+        """
+        Write pending observations and close the database.
+        """
+        self.flush()
+        with self._lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers = []
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def runs(self, limit=20):
+        """
+        :param limit: number of runs
+        :return: list of the last runs (id, test, switch, m720_type, porta, started, finished)
+        """
+        self.flush()
+        return self._reader().execute(
+            "SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+    def failure_rate(self, serial_number, port="ping", last_runs=20):
+        """
+        Failure rate of the M720 over its last runs (the runs with its observations).
+        :param serial_number: M720 serial number
+        :param port: ping, port_b or port_a
+        :param last_runs: number of the last runs
+        :return: failure rate (0 - 1), None if there are no observations
+        """
+        self.flush()
+        row = self._reader().execute(
+            "SELECT AVG(1 - ok) FROM observations WHERE serial_number = ? AND port = ? "
+            "AND run_id IN (SELECT DISTINCT run_id FROM observations "
+            "WHERE serial_number = ? AND port = ? ORDER BY run_id DESC LIMIT ?)",
+            (serial_number, port, serial_number, port, last_runs)
+        ).fetchone()
+        return row[0]
+
+    def _run(self, run_id):
+        row = self._reader().execute(
+            "SELECT m720_type, porta FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No run {run_id}")
+        return row
+
+    def legacy_header(self, run_id):
+        """
+        Header of the results CSV file of the run, the columns of legacy_rows.
+        :param run_id: run id
+        :return: list of column names
+        :raise KeyError: if there is no such run
+        """
+        m720_type, porta = self._run(run_id)
+        first, second = {"optic": ("new ", "old "), "copper": ("copper ", "optic ")}.get(
+            m720_type, ("", "other "))
+        header = ["Number of test", f"Reachable {first}s/n", f"Unreachable {first}s/n",
+                  f"Reachable {second}s/n", f"Unreachable {second}s/n", "Down interfaces (port B)"]
+        if porta:
+            header.append("Down interfaces (port A)")
+        return header
+
+    def legacy_rows(self, run_id, first_categories=("new", "copper")):
+        """
+        Rows of the run in the format of the results CSV file.
+        :param run_id: run id
+        :param first_categories: categories written in the first reachable/unreachable columns
+        :return: generator of [number of test, reachable first, unreachable first,
+        reachable second, unreachable second, down interfaces port b, (down interfaces port a)]
+        :raise KeyError: if there is no such run
+        """
+        self.flush()
+        _, porta = self._run(run_id)
+        cursor = self._reader().execute(
+            "SELECT iteration, serial_number, category, port, interface, ok FROM observations "
+            "WHERE run_id = ? ORDER BY iteration, rowid", (run_id,)
+        )
+        iteration = None
+        columns = None
+        for number, serial_number, category, port, interface, ok in cursor:
+            if number != iteration:
+                if columns is not None:
+                    yield _legacy_row(iteration, columns, porta)
+                iteration = number
+                columns = [[], [], [], [], [], []]
+            if port == "ping":
+                index = (0 if category in first_categories else 2) + (0 if ok else 1)
+                columns[index].append(str(serial_number))
+            elif not ok and interface:
+                columns[4 if port == "port_b" else 5].append(interface)
+        if columns is not None:
+            yield _legacy_row(iteration, columns, porta)
+
+
+def _legacy_row(iteration, columns, porta):
+    row = [iteration, *(", ".join(column) for column in columns)]
+    return row if porta else row[:-1]
+
+
+@click.command()
+@click.argument('database', type=click.Path(exists=True))
+@click.option('--sn', type=int, help="Failure rate of the M720 serial number.")
+@click.option('--port', type=click.Choice(['ping', 'port_b', 'port_a']), default='ping',
+              help="Observation for the failure rate.")
+@click.option('--runs', type=int, default=20, help="Number of the last runs.")
+@click.option('--export', type=int, help="Export the run with this id to a CSV file.")
+def main(database, sn, port, runs, export):
+    """
+    Query the link test result store.
+    """
+    with ResultStore(database) as store:
+        if sn is not None:
+            rate = store.failure_rate(sn, port=port, last_runs=runs)
+            if rate is None:
+                click.echo(f"No observations of {sn}")
+            else:
+                click.echo(f"Failure rate of {sn} ({port}) over the last {runs} runs: "
+                           f"{rate * 100:.2f} %")
+        elif export is not None:
+            try:
+                header = store.legacy_header(export)
+            except KeyError as error:
+                raise click.BadParameter(error.args[0], param_hint="--export")
+            file_name = f"link_test_run_{export}.csv"
+            with open(file_name, "w", encoding="UTF-8") as file:
+                file_writer = csv.writer(file, delimiter=";", lineterminator="\r")
+                file_writer.writerow(header)
+                file_writer.writerows(store.legacy_rows(export))
+            click.echo(file_name)
+        else:
+            for run in store.runs(limit=runs):
+                click.echo(";".join("" if value is None else str(value) for value in run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Parser of the switch CLI output.
+
+"show interface ethernet status" is parsed in one pass into a table
+interface -> (link, speed, duplex), e.g.:
+
+Interface   Link/Protocol   Speed   Duplex   Vlan   Type
+1/0/1       UP/UP           a-1G    a-FULL   1      G-TX
+1/0/10      DOWN/DOWN       auto    auto     1      G-TX
+"""
+import re
+from collections import namedtuple
+
+InterfaceStatus = namedtuple("InterfaceStatus", ["link", "speed", "duplex"])
+
+# Line starting with an interface name: optional prefix (Ethernet, eth) and unit/slot/port
+INTERFACE_STATUS_REGEX = re.compile(
+    r"^[ \t]*(?:[A-Za-z-]+)?(?P<intf>\d+(?:/\d+)+)[ \t]+(?P<link>\S+)"
+    r"(?:[ \t]+(?P<speed>\S+))?(?:[ \t]+(?P<duplex>\S+))?",
+    re.MULTILINE
+)
+
+
+def parse_interface_status(output):
+    """
+    Parse the output of "show interface ethernet status".
+    :param output: command output
+    :return: dictionary interface -> InterfaceStatus
+    """
+    return {
+        match.group("intf"): InterfaceStatus(
+            match.group("link"), match.group("speed"), match.group("duplex"))
+        for match in INTERFACE_STATUS_REGEX.finditer(output)
+    }
+
+
+def is_down(status):
+    """
+    :param status: InterfaceStatus
+    :return: True if the link is down (DOWN, A-DOWN)
+    """
+    return "down" in status.link.lower()
+
+
+def down_interfaces(status_table, intf_list):
+    """
+    :param status_table: result of parse_interface_status
+    :param intf_list: list of interfaces
+    :return: list of down interfaces and list of interfaces missing in the table
+    """
+    down = []
+    missing = []
+    for intf in intf_list:
+        status = status_table.get(intf)
+        if status is None:
+            missing.append(intf)
+        elif is_down(status):
+            down.append(intf)
+    return down, missing
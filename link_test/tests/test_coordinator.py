@@ -0,0 +1,169 @@
+import pytest
+import requests
+
+import link_test_m720
+from coordinator import (Coordinator, CoordinatorClient, UnknownJob, _is_loopback, run_worker,
+                         start_coordinator)
+from result_store import ResultStore
+
+DEFINITIONS = [
+    {"name": "bench1", "test": "reboot", "m720_type": "optic",
+     "switch1": {"ip": "192.168.89.93", "login": "admin"}},
+    {"name": "bench2", "test": "reboot", "m720_type": "copper",
+     "switch1": {"ip": "192.168.89.101", "login": "admin"}},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultStore(str(tmp_path / "results.sqlite")) as store:
+        yield store
+
+
+def test_jobs_are_handed_out_once(store):
+    coordinator = Coordinator(DEFINITIONS, store)
+    first = coordinator.next_job("host1")
+    second = coordinator.next_job("host2")
+    assert (first["id"], second["id"]) == (1, 2)
+    assert first["bench"] == DEFINITIONS[0]
+    # The jobs are running: the worker asks again later
+    assert coordinator.next_job("host3") == {"retry": coordinator.lease / 4}
+    coordinator.job_done(1, "link_test_reboot_bench1.csv", "host1")
+    coordinator.job_done(2, None, "host2")
+    assert [job["state"] for job in coordinator.status()] == ["done", "failed"]
+    assert coordinator.finished.is_set()
+    assert coordinator.next_job("host3") is None
+
+
+def test_expired_lease_is_handed_to_another_worker(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store, lease=0)
+    assert coordinator.next_job("host1")["id"] == 1
+    assert not coordinator.heartbeat(1, "host2")
+    assert coordinator.next_job("host2")["id"] == 1
+    assert not coordinator.heartbeat(1, "host1")
+    # The result of the worker that lost the lease is ignored
+    coordinator.job_done(1, "stale.csv", "host1")
+    assert coordinator.status()[0]["state"] == "running"
+    coordinator.job_done(1, "link_test_reboot_bench1.csv", "host2")
+    assert coordinator.status()[0]["state"] == "done"
+    assert coordinator.status()[0]["result"] == "link_test_reboot_bench1.csv"
+
+
+def test_heartbeat_renews_the_lease(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store, lease=60)
+    coordinator.next_job("host1")
+    assert coordinator.heartbeat(1, "host1")
+    coordinator.expire_leases()
+    assert coordinator.status()[0]["state"] == "running"
+
+
+def test_job_fails_after_the_attempts(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store, lease=0, attempts=2)
+    coordinator.next_job("host1")
+    coordinator.next_job("host2")
+    assert coordinator.next_job("host3") is None
+    assert coordinator.status()[0]["state"] == "failed"
+    assert coordinator.status()[0]["attempts"] == 2
+    assert coordinator.finished.is_set()
+
+
+def test_repeated_requests_are_stored_once(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store)
+    coordinator.next_job("host1")
+    run_id = coordinator.start_run(1, "reboot", "bench1", "optic", False, key="a")
+    assert coordinator.start_run(1, "reboot", "bench1", "optic", False, key="a") == run_id
+    assert coordinator.start_run(1, "reboot", "bench1", "optic", False, key="b") != run_id
+    rows = [[run_id, 1, 2967, "new", "ping", None, 1, 0.0],
+            [run_id, 1, 2967, "new", "port_b", "1/0/1", 1, 0.0]]
+    coordinator.add_observations(1, rows)
+    coordinator.add_observations(1, rows)
+    coordinator.add_observations(1, [[run_id, 2, 2967, "new", "ping", None, 0, 0.0]])
+    assert coordinator.status()[0]["observations"] == 3
+    assert list(store.legacy_rows(run_id)) == [[1, "2967", "", "", "", ""],
+                                               [2, "", "2967", "", "", ""]]
+
+
+@pytest.mark.parametrize("host, loopback", [
+    ("127.0.0.1", True), ("::1", True), ("localhost", True), ("0.0.0.0", False),
+])
+def test_is_loopback(host, loopback):
+    assert _is_loopback(host) == loopback
+
+
+def test_token_required_on_other_addresses(store):
+    with pytest.raises(ValueError):
+        start_coordinator(Coordinator(DEFINITIONS, store), host="0.0.0.0", port=0)
+
+
+def test_http_token_and_heartbeat(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store)
+    server = start_coordinator(coordinator, port=0, token="secret")
+    host, port = server.server_address
+    url = f"http://{host}:{port}"
+    try:
+        with pytest.raises(requests.HTTPError) as error:
+            CoordinatorClient(url, "host1", token="wrong", retries=1).next_job()
+        assert error.value.response.status_code == 401
+        client = CoordinatorClient(url, "host1", token="secret", retries=1)
+        assert client.next_job()["id"] == 1
+        assert client.heartbeat(1)
+        assert not CoordinatorClient(url, "host2", token="secret", retries=1).heartbeat(1)
+        client.job_done(1, "link_test_reboot_bench1.csv")
+        assert client.next_job() is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("job_id", [0, -1, 2])
+def test_unknown_job(store, job_id):
+    coordinator = Coordinator(DEFINITIONS[:1], store)
+    coordinator.next_job("host1")
+    with pytest.raises(UnknownJob):
+        coordinator.heartbeat(job_id, "host1")
+    with pytest.raises(UnknownJob):
+        coordinator.add_observations(job_id, [])
+    with pytest.raises(UnknownJob):
+        coordinator.job_done(job_id, "link_test_reboot_bench1.csv", "host1")
+    assert coordinator.status()[0]["state"] == "running"
+
+
+def test_http_unknown_job(store):
+    coordinator = Coordinator(DEFINITIONS[:1], store)
+    server = start_coordinator(coordinator, port=0)
+    host, port = server.server_address
+    try:
+        client = CoordinatorClient(f"http://{host}:{port}", "host1", retries=1)
+        client.next_job()
+        with pytest.raises(requests.HTTPError) as error:
+            client.heartbeat(0)
+        assert error.value.response.status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_worker_aborts_the_job_of_a_lost_lease(store, monkeypatch):
+    coordinator = Coordinator(DEFINITIONS[:1], store)
+    server = start_coordinator(coordinator, port=0)
+    host, port = server.server_address
+    aborted = []
+
+    def run_bench(bench, store=None, abort=None):
+        # The job is handed to another worker while the test runs
+        with coordinator._lock:
+            coordinator.jobs[0]["worker"] = "host2"
+        aborted.append(abort.wait(5))
+        coordinator.job_done(1, "host2.csv", "host2")
+        return "link_test_reboot_bench1.csv"
+
+    monkeypatch.setattr(link_test_m720, "run_bench", run_bench)
+    try:
+        assert run_worker(f"http://{host}:{port}", "host1", heartbeat=0.05) == {
+            1: "link_test_reboot_bench1.csv"}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert aborted == [True]
+    # The result of the aborted job is not reported
+    assert coordinator.status()[0]["result"] == "host2.csv"
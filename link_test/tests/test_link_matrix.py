@@ -0,0 +1,77 @@
+import pytest
+
+from link_matrix import LinkMatrix, _longest_streak
+
+SWITCH1_M720 = {591: "1/0/1", 592: "1/0/2"}
+SWITCH2_M720 = {591: "1/0/5", 592: "1/0/6"}
+
+
+@pytest.mark.parametrize("bitset, streak", [(0, 0), (0b1, 1), (0b1011, 2), (0b0111_0110, 3)])
+def test_longest_streak(bitset, streak):
+    assert _longest_streak(bitset) == streak
+
+
+def test_failure_rate_and_streak_across_bytes():
+    matrix = LinkMatrix(SWITCH1_M720)
+    # 591 fails in iterations 6 - 9, the bitset grows past the first byte
+    for iteration in range(12):
+        matrix.add_iteration({"ping": {591} if 6 <= iteration <= 9 else set()})
+    assert matrix.iterations == 12
+    assert matrix.bitsets("ping")[591] == 0b11_1100_0000
+    assert matrix.failure_rate("ping") == {591: 4 / 12, 592: 0.0}
+    assert matrix.longest_streak("ping") == {591: 4, 592: 0}
+    assert matrix.checked("ping")
+    assert not matrix.checked("port_b")
+
+
+def test_unknown_serial_number_is_ignored():
+    matrix = LinkMatrix(SWITCH1_M720)
+    matrix.add_iteration({"ping": {999}})
+    assert matrix.failure_rate("ping") == {591: 0.0, 592: 0.0}
+
+
+def test_failure_rate_without_iterations():
+    assert LinkMatrix(SWITCH1_M720).failure_rate("ping") == {591: 0.0, 592: 0.0}
+
+
+def test_bitsets_cache_is_reset_by_add_iteration():
+    matrix = LinkMatrix(SWITCH1_M720)
+    matrix.add_iteration({"ping": {591}})
+    assert matrix.bitsets("ping")[591] == 0b1
+    matrix.add_iteration({"ping": {591}})
+    assert matrix.bitsets("ping")[591] == 0b11
+
+
+def test_add_row():
+    matrix = LinkMatrix(SWITCH1_M720, SWITCH2_M720)
+    matrix.add_row(["591", "592", "", "", "1/0/2", "1/0/5, 1/0/9"], porta=True)
+    assert matrix.bitsets("ping") == {591: 0, 592: 1}
+    assert matrix.bitsets("port_b") == {591: 0, 592: 1}
+    # 1/0/9 is not an interface of the M720
+    assert matrix.bitsets("port_a") == {591: 1, 592: 0}
+    assert matrix.link_drops() == {591: 1, 592: 1}
+
+
+def test_correlation():
+    matrix = LinkMatrix(SWITCH1_M720)
+    for failed in ({591, 592}, {591}, set(), set()):
+        matrix.add_iteration({"ping": failed, "port_b": failed & {591}})
+    correlation = matrix.correlation("port_b", "ping")
+    assert correlation[591] == pytest.approx(1.0)
+    # The link of 592 never drops: a constant series has no correlation
+    assert correlation[592] is None
+
+
+def test_correlation_opposite_series():
+    matrix = LinkMatrix(SWITCH1_M720)
+    for ping, port_b in (({591}, set()), (set(), {591}), ({591}, set()), (set(), {591})):
+        matrix.add_iteration({"ping": ping, "port_b": port_b})
+    assert matrix.correlation(None, "ping")[591] == pytest.approx(-1.0)
+
+
+def test_hot_spots():
+    matrix = LinkMatrix(SWITCH1_M720)
+    matrix.add_iteration({"port_b": {592}})
+    matrix.add_iteration({"port_b": {591, 592}})
+    assert matrix.hot_spots("port_b") == [("1/0/2", 592, 2), ("1/0/1", 591, 1)]
+    assert matrix.hot_spots("port_b", top=1) == [("1/0/2", 592, 2)]
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from result_store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultStore(str(tmp_path / "results.sqlite"), batch_size=3) as store:
+        yield store
+
+
+def observations(run_id, iteration, ok_ping, ok_port_b, ok_port_a=None):
+    rows = []
+    for serial_number, category, interface in ((2967, "new", "1/0/1"), (2968, "old", "1/0/2")):
+        rows.append((run_id, iteration, serial_number, category, "ping", None,
+                     int(serial_number in ok_ping), 0.0))
+        rows.append((run_id, iteration, serial_number, category, "port_b", interface,
+                     int(serial_number in ok_port_b), 0.0))
+        if ok_port_a is not None:
+            rows.append((run_id, iteration, serial_number, category, "port_a", interface,
+                         int(serial_number in ok_port_a), 0.0))
+    return rows
+
+
+def test_runs_and_failure_rate(store):
+    first = store.start_run("power1", "24fx", "optic")
+    store.add_observations(observations(first, 1, {2967, 2968}, {2967, 2968}))
+    store.finish_run(first)
+    second = store.start_run("power1", "24fx", "optic")
+    store.add_observations(observations(second, 1, {2968}, {2968}))
+    assert [run[0] for run in store.runs()] == [second, first]
+    assert store.runs()[1][6] is not None
+    # The pending observations are written before the query
+    assert store.failure_rate(2967) == 0.5
+    assert store.failure_rate(2967, last_runs=1) == 1.0
+    assert store.failure_rate(2968, port="port_b") == 0.0
+    assert store.failure_rate(1) is None
+
+
+def test_failure_rate_over_the_runs_of_the_m720(store):
+    first = store.start_run("power1", "24fx", "optic")
+    store.add_observations(observations(first, 1, {2968}, {2967, 2968}))
+    # Later runs on another bench without the M720
+    for _ in range(3):
+        other = store.start_run("power1", "48gt", "optic")
+        store.add_observations([(other, 1, 3001, "new", "ping", None, 1, 0.0)])
+    assert store.failure_rate(2967, last_runs=2) == 1.0
+    assert store.failure_rate(3001, last_runs=2) == 0.0
+
+
+def test_legacy_rows(store):
+    run_id = store.start_run("power1", "24fx", "optic")
+    store.add_observations(observations(run_id, 1, {2967, 2968}, {2967, 2968}))
+    store.add_observations(observations(run_id, 2, {2968}, {2968}))
+    assert list(store.legacy_rows(run_id)) == [
+        [1, "2967", "", "2968", "", ""],
+        [2, "", "2967", "2968", "", "1/0/1"],
+    ]
+
+
+def test_legacy_rows_port_a(store):
+    run_id = store.start_run("power2", "24fx", "optic", porta=True)
+    store.add_observations(observations(run_id, 1, {2967}, {2967, 2968}, {2967}))
+    assert list(store.legacy_rows(run_id)) == [[1, "2967", "", "", "2968", "", "1/0/2"]]
+
+
+@pytest.mark.parametrize("m720_type, porta, header", [
+    ("optic", False, ["Number of test", "Reachable new s/n", "Unreachable new s/n",
+                      "Reachable old s/n", "Unreachable old s/n", "Down interfaces (port B)"]),
+    ("copper", True, ["Number of test", "Reachable copper s/n", "Unreachable copper s/n",
+                      "Reachable optic s/n", "Unreachable optic s/n", "Down interfaces (port B)",
+                      "Down interfaces (port A)"]),
+    (None, False, ["Number of test", "Reachable s/n", "Unreachable s/n",
+                   "Reachable other s/n", "Unreachable other s/n", "Down interfaces (port B)"]),
+])
+def test_legacy_header(store, m720_type, porta, header):
+    run_id = store.start_run("power2", "24fx", m720_type, porta=porta)
+    assert store.legacy_header(run_id) == header
+
+
+def test_legacy_header_matches_rows(store):
+    for porta in (False, True):
+        run_id = store.start_run("power2", "24fx", "optic", porta=porta)
+        store.add_observations(observations(run_id, 1, {2967}, {2967}, {2967} if porta else None))
+        row, = store.legacy_rows(run_id)
+        assert len(row) == len(store.legacy_header(run_id))
+
+
+def test_unknown_run(store):
+    with pytest.raises(KeyError, match="No run 7"):
+        store.legacy_header(7)
+    with pytest.raises(KeyError, match="No run 7"):
+        list(store.legacy_rows(7))
+
+
+def test_queries_from_threads(store):
+    run_id = store.start_run("reboot", "24fx", "optic")
+    store.add_observations(observations(run_id, 1, {2967}, {2967}))
+    rates = []
+    threads = [threading.Thread(target=lambda: rates.append(store.failure_rate(2968)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rates == [1.0] * 4
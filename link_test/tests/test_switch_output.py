@@ -0,0 +1,37 @@
+from switch_output import InterfaceStatus, down_interfaces, is_down, parse_interface_status
+
+OUTPUT = """show interface ethernet status
+Interface   Link/Protocol   Speed   Duplex   Vlan   Type
+---------   -------------   -----   ------   ----   ----
+1/0/1       UP/UP           a-1G    a-FULL   1      G-TX
+1/0/10      DOWN/DOWN       auto    auto     1      G-TX
+Ethernet1/0/11  A-DOWN/DOWN
+  eth1/0/12 UP/UP a-10G a-FULL
+Switch#"""
+
+
+def test_parse_interface_status():
+    table = parse_interface_status(OUTPUT)
+    assert table == {
+        "1/0/1": InterfaceStatus("UP/UP", "a-1G", "a-FULL"),
+        "1/0/10": InterfaceStatus("DOWN/DOWN", "auto", "auto"),
+        "1/0/11": InterfaceStatus("A-DOWN/DOWN", None, None),
+        "1/0/12": InterfaceStatus("UP/UP", "a-10G", "a-FULL"),
+    }
+
+
+def test_parse_interface_status_ignores_header_and_prompt():
+    assert parse_interface_status("Interface   Link/Protocol\n---------\nSwitch#") == {}
+
+
+def test_is_down():
+    assert is_down(InterfaceStatus("DOWN/DOWN", None, None))
+    assert is_down(InterfaceStatus("A-DOWN/DOWN", None, None))
+    assert not is_down(InterfaceStatus("UP/UP", None, None))
+
+
+def test_down_interfaces():
+    table = parse_interface_status(OUTPUT)
+    down, missing = down_interfaces(table, ["1/0/1", "1/0/10", "1/0/11", "1/0/2"])
+    assert down == ["1/0/10", "1/0/11"]
+    assert missing == ["1/0/2"]
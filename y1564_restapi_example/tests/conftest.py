@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The script is run directly (python3 y1564_test_restapi_example.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_m720 import FakeM720  # noqa: E402
+
+
+@pytest.fixture
+def m720():
+    m720 = FakeM720()
+    yield m720
+    m720.close()
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return tmp_path / "m720_ubus_sessions.json"
@@ -0,0 +1,157 @@
+"""
+Fake of the M720 ubus JSON-RPC API (uhttpd-mod-ubus) on localhost for the tests.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACCESS_DENIED = {"code": -32002, "message": "Access denied"}
+INVALID_REQUEST = {"code": -32600, "message": "Invalid request"}
+
+
+def flow(test, part, service):
+    return {
+        "info_rate": {"min_mbps": "99.9", "average_mbps": "100.0", "max_mbps": "100.1"},
+        "frame_delay": {"min_ms": "0.011", "average_ms": "0.012", "max_ms": "0.013"},
+        "delay_variation": {"average_ms": "0.001", "max_ms": "0.002"},
+        "loss_percents": "0.0", "unordered_percents": "0.0",
+        "stat": {"rx_pkts": 1000, "rx_unordered_pkts": 0, "tx_pkts": 1000},
+        "test": test, "part": part, "service": service,
+    }
+
+
+class FakeM720:
+    """
+    One M720: ubus sessions, the Y.1564 parameters and a test with parts of part_time seconds.
+    """
+
+    def __init__(self, login="admin", password="PleaseChangeTheAdminPassword"):
+        self.login = login
+        self.password = password
+        # batch - JSON-RPC batches are handled, reverse - the replies of a batch are reversed,
+        # delay - time of each HTTP request (s), start_status - ubus status of the start call
+        self.batch = True
+        self.reverse = False
+        self.delay = 0.0
+        self.start_status = 0
+        self.part_time = 0.2
+        self.sessions = {}
+        self.params = {}
+        self.started = None
+        self.stopped = None
+        # max_in_flight - most HTTP requests handled at the same time
+        self.stats = {"logins": 0, "posts": 0, "batches": 0, "calls": 0, "max_in_flight": 0}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.m720 = self
+        host, port = self.server.server_address
+        self.address = f"{host}:{port}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def expire_sessions(self):
+        self.sessions.clear()
+
+    def parts(self):
+        y1564 = self.params.get(("y1564",), {}).get("y1564", {})
+        return ([("cir", part) for part in range(y1564.get("step_count", 4))]
+                + [("eir", 0), ("tp", 0), ("perf", 0)])
+
+    def common_status(self):
+        if self.started is None:
+            return {"status": False, "retmsg": "OK", "cur_test": "cir", "cur_part": 0,
+                    "sys_time": {"start_us": "0", "stop_us": "0", "elapsed_us": "0"}}
+        parts = self.parts()
+        now = time.time()
+        if self.stopped is None and now - self.started >= len(parts) * self.part_time:
+            self.stopped = self.started + len(parts) * self.part_time
+        elapsed = (self.stopped or now) - self.started
+        test, part = parts[min(int(elapsed / self.part_time), len(parts) - 1)]
+        return {"status": self.stopped is None, "retmsg": "OK", "cur_test": test,
+                "cur_part": part,
+                "sys_time": {"start_us": str(int(self.started * 1000000)),
+                             "stop_us": str(int((self.stopped or 0) * 1000000)),
+                             "elapsed_us": str(int(elapsed * 1000000))}}
+
+    def handle(self, request):
+        token, ubus_object, method, params = request["params"]
+        reply = {"jsonrpc": "2.0", "id": request.get("id")}
+        with self._lock:
+            self.stats["calls"] += 1
+            if ubus_object == "session" and method == "login":
+                if (params.get("username"), params.get("password")) != (self.login,
+                                                                        self.password):
+                    return dict(reply, result=[6])
+                self.stats["logins"] += 1
+                token = uuid.uuid4().hex
+                self.sessions[token] = time.time() + params.get("timeout", 300)
+                return dict(reply, result=[0, {"ubus_rpc_session": token}])
+            if self.sessions.get(token, 0) < time.time():
+                return dict(reply, error=ACCESS_DENIED)
+            ids = params.get("ids", {})
+            key = ("service", ids["service"]) if "service" in ids else ("y1564",)
+            if method == "setprm":
+                self.params[key] = params["parameters"]
+                data = {}
+            elif method == "start" and self.start_status:
+                return dict(reply, result=[self.start_status])
+            elif method == "start":
+                self.started, self.stopped = time.time(), None
+                data = {}
+            elif method == "stop":
+                self.stopped = time.time()
+                data = {}
+            elif method == "getsts" and "test" in ids:
+                data = {"answer": [{"statuses": {"flows": [
+                    flow(ids["test"], ids["part"], ids["service"])]}}]}
+            elif method == "getsts":
+                data = {"answer": [{"statuses": self.common_status()}]}
+            else:
+                return dict(reply, error={"code": -32601, "message": "Method not found"})
+            return dict(reply, result=[0, data])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        m720 = self.server.m720
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with m720._lock:
+            m720.stats["posts"] += 1
+            m720.in_flight += 1
+            m720.stats["max_in_flight"] = max(m720.stats["max_in_flight"], m720.in_flight)
+        try:
+            self._reply(m720, body)
+        finally:
+            with m720._lock:
+                m720.in_flight -= 1
+
+    def _reply(self, m720, body):
+        time.sleep(m720.delay)
+        if isinstance(body, list):
+            m720.stats["batches"] += 1
+            if m720.batch:
+                reply = [m720.handle(request) for request in body]
+                if m720.reverse:
+                    reply.reverse()
+            else:
+                reply = {"jsonrpc": "2.0", "id": None, "error": INVALID_REQUEST}
+        else:
+            reply = m720.handle(body)
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
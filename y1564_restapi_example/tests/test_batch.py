@@ -0,0 +1,80 @@
+import y1564_test_restapi_example as y1564
+from y1564_test_restapi_example import M720Client, get_y1564_results, y1564_status_call
+
+PARAMS = dict(y1564.y1564_parameters, service_count=2, step_count=2)
+PARTS = [("cir", 0), ("cir", 1), ("eir", 0), ("tp", 0), ("perf", 0)]
+
+
+def test_all_results_in_one_batch(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        results = get_y1564_results(client, PARAMS)
+        assert client.batch_supported is True
+    # Login and one batch
+    assert m720.stats["posts"] == 2
+    assert m720.stats["batches"] == 1
+    assert results["statuses"]["cur_test"] == "cir"
+    assert list(results["services"]) == [0, 1]
+    for service, parts in results["services"].items():
+        assert list(parts) == PARTS
+        for (test, part), flow in parts.items():
+            assert (flow["test"], flow["part"], flow["service"]) == (test, part, service)
+
+
+def test_replies_are_matched_by_id(m720, cache_file):
+    m720.reverse = True
+    calls = [y1564_status_call(0, test, part) for test, part in PARTS]
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        replies = client.call_many(calls)
+    assert [y1564._flow(reply)["test"] for reply in replies] == [test for test, _ in PARTS]
+
+
+def test_batch_after_the_session_expired(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        client.call(*y1564_status_call())
+        m720.expire_sessions()
+        results = get_y1564_results(client, PARAMS)
+    assert m720.stats["logins"] == 2
+    assert m720.stats["batches"] == 2
+    assert all(flow is not None for flow in results["services"][1].values())
+
+
+def test_rejected_batch_falls_back_to_single_calls(m720, cache_file):
+    m720.batch = False
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        first = get_y1564_results(client, PARAMS)
+        assert client.batch_supported is False
+        second = get_y1564_results(client, PARAMS)
+    # The batch is tried once, then each call is a request
+    assert m720.stats["batches"] == 1
+    assert m720.stats["posts"] == 1 + 1 + 2 * (1 + 2 * len(PARTS))
+    assert first["services"] == second["services"]
+    assert first["services"][1][("perf", 0)]["service"] == 1
+
+
+def test_calls_without_batches_share_the_workers(m720, cache_file):
+    m720.batch = False
+    m720.delay = 0.02
+    calls = [y1564_status_call(0, test, part) for test, part in PARTS]
+    with M720Client(m720.address, cache_file=cache_file, workers=2) as client:
+        client.call_many(calls)
+        executor = client._executor
+        client.call_many(calls)
+        assert client._executor is executor
+    assert client._executor is None
+    assert m720.stats["max_in_flight"] == 2
+
+
+def test_calls_without_batches_one_by_one(m720, cache_file):
+    m720.batch = False
+    m720.delay = 0.02
+    calls = [y1564_status_call(0, test, part) for test, part in PARTS]
+    with M720Client(m720.address, cache_file=cache_file, workers=1) as client:
+        client.call_many(calls)
+        assert client._executor is None
+    assert m720.stats["max_in_flight"] == 1
+
+
+def test_empty_call_list(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        assert client.call_many([]) == []
+    assert m720.stats["posts"] == 0
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+
+import pytest
+
+import y1564_test_restapi_example as y1564
+from fake_m720 import FakeM720
+from y1564_test_restapi_example import fleet_summary, run_fleet
+
+PARAMS = dict(y1564.y1564_parameters, step_count=2, conf_duration_useconds="200000",
+              perf_duration_useconds="200000")
+
+
+@pytest.fixture
+def fleet(monkeypatch, cache_file):
+    monkeypatch.setattr(y1564, "M720Client", functools.partial(y1564.M720Client,
+                                                               cache_file=cache_file))
+    m720_list = [FakeM720() for _ in range(3)]
+    yield m720_list
+    for m720 in m720_list:
+        m720.close()
+
+
+def test_show(fleet):
+    results = asyncio.run(run_fleet([m720.address for m720 in fleet], "show", PARAMS))
+    assert list(results) == [m720.address for m720 in fleet]
+    assert all(result["ok"] for result in results.values())
+    assert all(len(result["results"]["services"][0]) == 5 for result in results.values())
+
+
+def test_run(fleet):
+    results = asyncio.run(run_fleet([fleet[0].address], "run", PARAMS, fast=0.05, slow=0.2))
+    result = results[fleet[0].address]
+    assert result["ok"], result
+    assert result["results"]["statuses"]["status"] is False
+    assert all(flow is not None for flow in result["results"]["services"][0].values())
+    assert fleet[0].params[("service", 0)]["frame_size"] == y1564.service0_parameters[
+        "frame_size"]
+    assert "5/5 parts with results" in fleet_summary(results)
+
+
+def test_failed_start_is_not_ok(fleet):
+    fleet[0].start_status = 5
+    results = asyncio.run(run_fleet([m720.address for m720 in fleet[:2]], "run", PARAMS,
+                                    fast=0.05, slow=0.2))
+    assert results[fleet[0].address]["ok"] is False
+    assert "Start of the test" in results[fleet[0].address]["error"]
+    assert results[fleet[1].address]["ok"]
+
+
+def test_fleet_without_batches_keeps_one_request_per_m720(fleet):
+    for m720 in fleet:
+        m720.batch = False
+        m720.delay = 0.02
+    results = asyncio.run(run_fleet([m720.address for m720 in fleet], "show", PARAMS,
+                                    concurrency=2))
+    assert all(result["ok"] for result in results.values())
+    assert all(m720.stats["max_in_flight"] == 1 for m720 in fleet)
+
+
+def test_slow_m720_times_out_alone(fleet):
+    fleet[1].delay = 1.0
+    results = asyncio.run(run_fleet([m720.address for m720 in fleet], "show", PARAMS,
+                                    timeout=0.5))
+    assert results[fleet[1].address]["ok"] is False
+    assert results[fleet[1].address]["error"] == "timeout 0.5 s"
+    for m720 in (fleet[0], fleet[2]):
+        assert results[m720.address]["ok"]
+        assert results[m720.address]["elapsed"] < 0.5
+
+
+def test_unreachable_m720_does_not_stop_the_others(fleet):
+    fleet[0].close()
+    results = asyncio.run(run_fleet([m720.address for m720 in fleet], "show", PARAMS))
+    assert results[fleet[0].address]["ok"] is False
+    assert "ConnectionError" in results[fleet[0].address]["error"]
+    assert results[fleet[1].address]["ok"] and results[fleet[2].address]["ok"]
+    assert f"{fleet[0].address}: failed in" in fleet_summary(results)
+
+
+def test_invalid_profile_is_sent_to_no_m720(fleet):
+    with pytest.raises(ValueError):
+        asyncio.run(run_fleet([fleet[0].address], "run", dict(PARAMS, step_count=0)))
+    assert fleet[0].stats["posts"] == 0
@@ -0,0 +1,69 @@
+import json
+import stat
+
+import pytest
+
+from fake_m720 import FakeM720
+from y1564_test_restapi_example import AccessDenied, M720Client, y1564_status_call
+
+
+def test_session_is_reused(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        for _ in range(3):
+            assert client.call(*y1564_status_call())["result"][0] == 0
+    assert m720.stats["logins"] == 1
+    assert m720.stats["posts"] == 4
+
+
+def test_session_is_cached_between_runs(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        client.call(*y1564_status_call())
+    assert stat.S_IMODE(cache_file.stat().st_mode) == 0o600
+    assert list(json.loads(cache_file.read_text())) == [f"admin@{m720.address}"]
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        client.call(*y1564_status_call())
+    assert m720.stats["logins"] == 1
+
+
+def test_expired_cache_entry_is_ignored(m720, cache_file):
+    cache_file.write_text(json.dumps({f"admin@{m720.address}": {"token": "old", "expires": 1}}))
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        assert client.call(*y1564_status_call())["result"][0] == 0
+    assert m720.stats["logins"] == 1
+
+
+def test_relogin_when_the_m720_drops_the_session(m720, cache_file):
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        client.call(*y1564_status_call())
+        # e.g. the M720 rebooted: the cached session is still valid on our side
+        m720.expire_sessions()
+        assert client.call(*y1564_status_call())["result"][0] == 0
+    assert m720.stats["logins"] == 2
+    with M720Client(m720.address, cache_file=cache_file) as client:
+        client.call(*y1564_status_call())
+    assert m720.stats["logins"] == 2
+
+
+def test_clients_of_several_m720_share_the_cache(cache_file):
+    first, second = FakeM720(), FakeM720()
+    try:
+        for m720 in (first, second):
+            with M720Client(m720.address, cache_file=cache_file) as client:
+                client.call(*y1564_status_call())
+        assert len(json.loads(cache_file.read_text())) == 2
+    finally:
+        first.close()
+        second.close()
+
+
+def test_wrong_password(m720, cache_file):
+    with M720Client(m720.address, password="wrong", cache_file=cache_file) as client:
+        with pytest.raises(AccessDenied, match="Login to"):
+            client.call(*y1564_status_call())
+
+
+def test_without_cache(m720):
+    with M720Client(m720.address, cache_file=None) as client:
+        client.call(*y1564_status_call())
+        client.call(*y1564_status_call())
+    assert m720.stats["logins"] == 1
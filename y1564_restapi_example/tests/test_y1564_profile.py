@@ -0,0 +1,135 @@
+import pytest
+
+import y1564_test_restapi_example as y1564
+from y1564_test_restapi_example import M720Client, apply_profile, validate_profile
+
+OK = {"jsonrpc": "2.0", "id": 1, "result": [0, {}]}
+
+
+def test_default_profile():
+    assert validate_profile(y1564.y1564_parameters, y1564.services_parameters) == [
+        y1564.service0_parameters]
+
+
+def test_selected_services_in_the_order_of_the_numbers():
+    params = dict(y1564.y1564_parameters, service_count=3)
+    services = [y1564.service2_parameters, y1564.service0_parameters, y1564.service1_parameters]
+    assert [service["service_number"] for service in validate_profile(params, services)] == [
+        0, 1, 2]
+
+
+def test_all_errors_are_reported():
+    params = dict(y1564.y1564_parameters, service_count=2, step_count=11,
+                  topology_rx_port="portc")
+    service1 = dict(y1564.service1_parameters, src_mac="00:21:CE:44:00", vlan_id1=5000,
+                    cir_rate_units="percents", cir_rate_value="150")
+    with pytest.raises(ValueError) as error:
+        validate_profile(params, [y1564.service0_parameters, service1])
+    assert str(error.value).splitlines() == [
+        "y1564: step_count must be 1 - 10, not 11",
+        "y1564: topology_rx_port must be one of ('porta', 'portb'), not 'portc'",
+        "service 1: src_mac is not a MAC address: '00:21:CE:44:00'",
+        "service 1: vlan_id1 must be 0 - 4095, not 5000",
+        "service 1: cir_rate_value must be 0 - 100, not '150'",
+    ]
+
+
+def test_missing_parameter_is_reported_once():
+    service0 = dict(y1564.service0_parameters)
+    del service0["frame_size"]
+    with pytest.raises(ValueError) as error:
+        validate_profile(y1564.y1564_parameters, [service0])
+    assert str(error.value) == "service 0: missing parameter 'frame_size'"
+
+
+@pytest.mark.parametrize("params, services, message", [
+    (dict(y1564.y1564_parameters, service_count=2), [y1564.service0_parameters],
+     "service 1: no parameters for service_count 2"),
+    (dict(y1564.y1564_parameters, service_count=0), [],
+     "y1564: service_count must be 1 - 4, not 0"),
+    (y1564.y1564_parameters, [y1564.service0_parameters, y1564.service0_parameters],
+     "service 0: defined twice"),
+    (dict(y1564.y1564_parameters, cir_enabled=False, eir_enabled=False, tp_enabled=False,
+          perf_enabled=False), [y1564.service0_parameters], "y1564: no test is enabled"),
+    (dict(y1564.y1564_parameters, perf_duration_useconds="0"), [y1564.service0_parameters],
+     "y1564: perf_duration_useconds must be >= 1, not '0'"),
+])
+def test_invalid_profile(params, services, message):
+    with pytest.raises(ValueError, match=message):
+        validate_profile(params, services)
+
+
+class RecordingClient(M720Client):
+    """
+    M720Client without the M720: the calls are recorded.
+    """
+
+    def __init__(self, batch_supported, replies=None):
+        super().__init__("192.168.90.181", cache_file=None)
+        self.batch_supported = batch_supported
+        self.replies = replies or {}
+        self.calls = []
+        self.batches = []
+
+    def call(self, ubus_object, method, params=None):
+        self.calls.append((ubus_object, method, params))
+        return self.replies.get((ubus_object, method), OK)
+
+    def _batch(self, token, calls):
+        self.batches.append(calls)
+        return [OK for _ in calls]
+
+    @property
+    def token(self):
+        return "token"
+
+
+def test_apply_profile_in_one_batch():
+    params = dict(y1564.y1564_parameters, service_count=2)
+    client = RecordingClient(batch_supported=None)
+    assert apply_profile(client, params, y1564.services_parameters) == OK
+    assert [(call[0], call[1]) for call in client.batches[0]] == [("y1564", "setprm")] * 3
+    assert client.calls == [("y1564", "start", {"ids": {"profile": y1564.PROFILE}})]
+
+
+def test_apply_profile_without_batches_sets_service_count_first():
+    params = dict(y1564.y1564_parameters, service_count=4)
+    client = RecordingClient(batch_supported=False)
+    apply_profile(client, params, y1564.services_parameters, start=False)
+    assert client.batches == []
+    assert client.calls[0] == y1564.y1564_setprm_call(params)
+    assert sorted(call[2]["ids"]["service"] for call in client.calls[1:]) == [
+        0, 1, 2, 3]
+
+
+def test_call_many_first_calls():
+    client = RecordingClient(batch_supported=False)
+    calls = [("y1564", "getsts", {"ids": {"n": number}}) for number in range(5)]
+    assert client.call_many(calls, first=5) == [OK] * 5
+    assert client.calls == calls
+
+
+def test_apply_profile_rejected():
+    client = RecordingClient(batch_supported=False,
+                             replies={("y1564", "setprm"): {"result": [2]}})
+    with pytest.raises(RuntimeError, match="y1564: .*service 0: "):
+        apply_profile(client, y1564.y1564_parameters, y1564.services_parameters)
+    assert ("y1564", "start") not in [(call[0], call[1]) for call in client.calls]
+
+
+@pytest.mark.parametrize("reply", [
+    {"jsonrpc": "2.0", "id": 1, "result": [5]},
+    {"jsonrpc": "2.0", "id": 1, "error": {"code": -32002, "message": "Access denied"}},
+])
+def test_apply_profile_start_failed(reply):
+    client = RecordingClient(batch_supported=None, replies={("y1564", "start"): reply})
+    with pytest.raises(RuntimeError, match="Start of the test on 192.168.90.181 failed"):
+        apply_profile(client, y1564.y1564_parameters, y1564.services_parameters)
+
+
+def test_invalid_profile_is_not_sent():
+    client = RecordingClient(batch_supported=None)
+    with pytest.raises(ValueError):
+        apply_profile(client, dict(y1564.y1564_parameters, step_count=0),
+                      y1564.services_parameters)
+    assert client.calls == client.batches == []
@@ -0,0 +1,140 @@
+import pytest
+
+import y1564_test_restapi_example as y1564
+from y1564_test_restapi_example import Y1564Watcher
+
+# CIR in 2 steps, EIR, TP and PERF of 4 s each
+PARAMS = dict(y1564.y1564_parameters, service_count=2, step_count=2,
+              conf_duration_useconds="4000000", perf_duration_useconds="4000000")
+
+
+def statuses(test, part, running=True, elapsed=0.0, stopped=False):
+    return {"status": running, "cur_test": test, "cur_part": part,
+            "sys_time": {"start_us": "1", "elapsed_us": str(int(elapsed * 1000000)),
+                         "stop_us": "2" if stopped else "0"}}
+
+
+def reply(flow):
+    return {"result": [0, {"answer": [{"statuses": {"flows": [flow] if flow else []}}]}]}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(y1564.time, "monotonic", clock)
+    return clock
+
+
+def test_parts():
+    watcher = Y1564Watcher(PARAMS)
+    assert watcher.parts == [("cir", 0), ("cir", 1), ("eir", 0), ("tp", 0), ("perf", 0)]
+    assert watcher.services == [0, 1]
+
+
+def test_finished_parts(clock):
+    watcher = Y1564Watcher(PARAMS)
+    assert watcher.update(statuses("cir", 0)) == []
+    assert watcher.update(statuses("cir", 0)) == []
+    assert watcher.update(statuses("cir", 1)) == [("cir", 0)]
+    # Parts skipped between two statuses are finished too
+    assert watcher.update(statuses("tp", 0)) == [("cir", 1), ("eir", 0)]
+    assert not watcher.done
+    assert watcher.update(statuses("perf", 0, running=False)) == [("tp", 0), ("perf", 0)]
+    assert watcher.done
+    assert watcher.update(statuses("perf", 0, running=False)) == []
+
+
+def test_watch_of_a_stopped_test(clock):
+    watcher = Y1564Watcher(PARAMS)
+    # Stopped during EIR: the parts after it have no results
+    assert watcher.update(statuses("eir", 0, running=False, stopped=True)) == [
+        ("cir", 0), ("cir", 1), ("eir", 0)]
+    assert watcher.done
+
+
+def test_watch_of_a_test_that_never_ran(clock):
+    watcher = Y1564Watcher(PARAMS)
+    assert watcher.update(statuses("cir", 0, running=False)) == []
+    assert watcher.done
+
+
+def test_unknown_part_at_the_end(clock):
+    watcher = Y1564Watcher(PARAMS)
+    watcher.update(statuses("cir", 0))
+    assert watcher.update(statuses("", 0, running=False)) == watcher.parts
+
+
+def test_next_delay(clock):
+    watcher = Y1564Watcher(PARAMS, fast=0.5, slow=10)
+    watcher.update(statuses("cir", 0))
+    # Half of the remaining time of the part
+    assert watcher.next_delay() == 2
+    clock.now += 3.8
+    assert watcher.next_delay() == 0.5
+    # The part is late: the interval grows up to the slow one
+    clock.now += 4
+    assert watcher.next_delay() == pytest.approx(0.95)
+    clock.now += 100
+    assert watcher.next_delay() == 10
+
+
+def test_next_delay_slow_limit(clock):
+    params = dict(PARAMS, conf_duration_useconds="60000000")
+    watcher = Y1564Watcher(params, fast=0.5, slow=10)
+    watcher.update(statuses("cir", 0))
+    assert watcher.next_delay() == 10
+
+
+def test_watch_started_during_a_part(clock):
+    watcher = Y1564Watcher(PARAMS, fast=0.5, slow=10)
+    # 1 s of the second CIR step is over
+    watcher.update(statuses("cir", 1, elapsed=5))
+    assert watcher.next_delay() == pytest.approx(1.5)
+
+
+def test_part_changed_between_statuses(clock):
+    watcher = Y1564Watcher(PARAMS, fast=0.5, slow=10)
+    watcher.update(statuses("cir", 0))
+    clock.now += 4
+    watcher.update(statuses("cir", 0))
+    clock.now += 2
+    watcher.update(statuses("cir", 1))
+    # The step started between the statuses, 1 s ago
+    assert watcher.next_delay() == pytest.approx(1.5)
+
+
+def test_part_without_time(clock):
+    # The parts end after a number of bytes: fast polling from the start of the part
+    params = dict(PARAMS, conf_duration_useconds="0", conf_duration_bytes="1000000")
+    watcher = Y1564Watcher(params, fast=0.5, slow=10)
+    watcher.update(statuses("cir", 0))
+    assert watcher.next_delay() == 0.5
+    clock.now += 8
+    assert watcher.next_delay() == 2
+
+
+def test_results(clock):
+    watcher = Y1564Watcher(PARAMS)
+    watcher.update(statuses("cir", 0))
+    finished = watcher.update(statuses("eir", 0))
+    calls = watcher.parts_calls(finished)
+    assert [call[2]["ids"] for call in calls] == [
+        {"profile": y1564.PROFILE, "test": "cir", "part": 0, "service": 0},
+        {"profile": y1564.PROFILE, "test": "cir", "part": 0, "service": 1},
+        {"profile": y1564.PROFILE, "test": "cir", "part": 1, "service": 0},
+        {"profile": y1564.PROFILE, "test": "cir", "part": 1, "service": 1},
+    ]
+    parts = watcher.add_results(finished, [reply({"id": 1}), reply(None), reply({"id": 3}),
+                                           {"error": {"code": -32000}}])
+    assert parts == [("cir", 0, {0: {"id": 1}, 1: None}), ("cir", 1, {0: {"id": 3}, 1: None})]
+    assert watcher.results["services"][0] == {("cir", 0): {"id": 1}, ("cir", 1): {"id": 3}}
+    assert watcher.results["statuses"]["cur_test"] == "eir"
@@ -3,12 +3,38 @@ Script demonstrates an example of working with the M720 (Smart SFP) to configure
 and output the Y.1564 test results using the REST API.
 """
 import argparse
+import asyncio
+import functools
+import ipaddress
+import itertools
+import json
+import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import requests
 
 IP_ADDRESS = "192.168.1.1"  # M720 (Smart# SFP) IP address
 
+LOGIN = "admin"  # change if you have another login
+PASSWORD = "PleaseChangeTheAdminPassword"  # change if you have another password
+SESSION_TIMEOUT = 300  # ubus session timeout (s)
+# ubus sessions of the M720 are kept here between runs of the script
+SESSION_CACHE = Path.home() / ".cache" / "m720_ubus_sessions.json"
+HTTP_POOL_SIZE = 8  # HTTP connections kept open to each M720
+HTTP_TIMEOUT = 10  # timeout of each request (s)
+
+# Watch mode: the status is polled fast near the expected end of a test part, slowly in between
+WATCH_FAST_POLL = 0.5  # minimum status polling interval (s)
+WATCH_SLOW_POLL = 10  # maximum status polling interval (s)
+
+# Several M720 (--devices file)
+FLEET_CONCURRENCY = 16  # requests to the M720 in progress at the same time
+FLEET_TIMEOUT = 1800  # maximum time of the action on one M720 (s)
+
 PROFILE = "profile0"  # configuration profile <profile0 | profile1>
 
 # If you use several services, don't forget to specify their number
@@ -239,207 +265,633 @@ service3_parameters = {
     "unordered_percents": "0.00000",  # OOP value in %
 }
 
+# The first service_count services of the list are configured by start
+services_parameters = [service0_parameters, service1_parameters, service2_parameters,
+                       service3_parameters]
+
+
+class AccessDenied(Exception):
+    """
+    The ubus session is expired or has no access to the object.
+    """
+
+
+class M720Client:
+    """
+    JSON-RPC client of one M720.
+
+    The HTTP connections are kept open between requests (requests.Session).
+    The ubus session is cached on disk with its expiry, so the next run of the script
+    does not log in again. The session is renewed when it expires or the M720 denies access.
+    """
+
+    # uhttpd-mod-ubus JSON-RPC error and ubus status of a session without access
+    ACCESS_DENIED_ERROR = -32002
+    # JSON-RPC error of a request the server can't handle, e.g. a batch
+    INVALID_REQUEST_ERROR = -32600
+    UBUS_STATUS_PERMISSION_DENIED = 6
+    # The session is renewed a bit before it expires on the M720
+    EXPIRY_MARGIN = 10
+    # The cache file is shared by the clients of all M720
+    _cache_lock = threading.Lock()
+
+    def __init__(self, ip_addr, login=LOGIN, password=PASSWORD, timeout=SESSION_TIMEOUT,
+                 cache_file=SESSION_CACHE, workers=HTTP_POOL_SIZE):
+        """
+        :param ip_addr: M720 IP address
+        :param login: M720 login
+        :param password: M720 password
+        :param timeout: ubus session timeout (s)
+        :param cache_file: file with the cached sessions, None - the session is not cached
+        :param workers: number of calls made at the same time by call_many if the M720 rejects
+        batches, 1 - one by one
+        """
+        self.ip_addr = ip_addr
+        self.url = f"http://{ip_addr}/api"
+        self.login = login
+        self.password = password
+        self.timeout = timeout
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.workers = workers
+        # Workers of call_many without batches, created on the first use
+        self._executor = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # None - not known yet, False - the M720 rejects JSON-RPC batches
+        self.batch_supported = None
+        self._token, self._expires = self._read_cache()
+
+    def _cache_key(self):
+        return f"{self.login}@{self.ip_addr}"
+
+    def _read_cache(self):
+        if not self.cache_file:
+            return None, 0
+        try:
+            with open(self.cache_file, "r", encoding="UTF-8") as file:
+                entry = json.load(file).get(self._cache_key())
+        except (OSError, ValueError):
+            return None, 0
+        if not entry or entry["expires"] <= time.time():
+            return None, 0
+        return entry["token"], entry["expires"]
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        with self._cache_lock:
+            try:
+                with open(self.cache_file, "r", encoding="UTF-8") as file:
+                    sessions = json.load(file)
+            except (OSError, ValueError):
+                sessions = {}
+            now = time.time()
+            sessions = {key: entry for key, entry in sessions.items() if entry["expires"] > now}
+            if self._token:
+                sessions[self._cache_key()] = {"token": self._token, "expires": self._expires}
+            else:
+                sessions.pop(self._cache_key(), None)
+            # The session gives access to the M720: the file is readable by the owner only
+            temporary = f"{self.cache_file}.{os.getpid()}.tmp"
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w",
+                          encoding="UTF-8") as file:
+                    json.dump(sessions, file)
+                os.replace(temporary, self.cache_file)
+            except OSError as error:
+                # Without the cache the next run logs in again
+                print(f"Session cache {self.cache_file} is not written: {error}")
+
+    def payload(self, token, ubus_object, method, params):
+        """
+        :return: JSON-RPC request of the ubus call
+        """
+        return {"jsonrpc": "2.0", "id": next(self._ids), "method": "call",
+                "params": [token, ubus_object, method, params]}
+
+    def post(self, payload):
+        """
+        :param payload: JSON-RPC request or list of requests
+        :return: JSON reply
+        """
+        response = self.session.post(self.url, json=payload, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def connect(self):
+        """
+        Log in and cache the new ubus session.
+        :return: ubus session id
+        """
+        reply = self.post(self.payload(
+            "00000000000000000000000000000000", "session", "login",
+            {"username": self.login, "password": self.password, "timeout": self.timeout}))
+        try:
+            token = reply["result"][1]["ubus_rpc_session"]
+        except (KeyError, IndexError, TypeError):
+            raise AccessDenied(f"Login to {self.ip_addr} failed: {reply}") from None
+        with self._lock:
+            self._token = token
+            self._expires = time.time() + self.timeout - self.EXPIRY_MARGIN
+            self._write_cache()
+        return token
+
+    @property
+    def token(self):
+        """
+        :return: ubus session id, a new session if there is no valid one
+        """
+        with self._lock:
+            if self._token and self._expires > time.time():
+                return self._token
+        return self.connect()
+
+    def _touch(self):
+        # The ubus session timeout is restarted by each call
+        with self._lock:
+            self._expires = time.time() + self.timeout - self.EXPIRY_MARGIN
+
+    @classmethod
+    def is_access_denied(cls, reply):
+        """
+        :param reply: JSON-RPC reply
+        :return: True if the session is expired or has no access
+        """
+        error = reply.get("error")
+        if error:
+            return error.get("code") == cls.ACCESS_DENIED_ERROR
+        result = reply.get("result")
+        return isinstance(result, list) and result[:1] == [cls.UBUS_STATUS_PERMISSION_DENIED]
+
+    def call(self, ubus_object, method, params):
+        """
+        Call the ubus method, log in again if the session is expired.
+        :param ubus_object: ubus object, e.g. y1564
+        :param method: method, e.g. getsts
+        :param params: method parameters
+        :return: JSON-RPC reply
+        """
+        token = self.token
+        reply = self.post(self.payload(token, ubus_object, method, params))
+        if self.is_access_denied(reply):
+            with self._lock:
+                # Another thread may have renewed the session already
+                if self._token == token:
+                    self._token = None
+            reply = self.post(self.payload(self.token, ubus_object, method, params))
+            if self.is_access_denied(reply):
+                raise AccessDenied(f"Access denied to {ubus_object}.{method} on {self.ip_addr}")
+        self._touch()
+        return reply
+
+    def _batch(self, token, calls):
+        payloads = [self.payload(token, *call) for call in calls]
+        try:
+            replies = self.post(payloads)
+        except (requests.HTTPError, ValueError):
+            # HTTP error or not a JSON reply to the batch
+            return None
+        if not isinstance(replies, list):
+            return None
+        by_id = {reply.get("id"): reply for reply in replies if isinstance(reply, dict)}
+        if len(by_id) != len(payloads) or any(payload["id"] not in by_id
+                                               for payload in payloads):
+            return None
+        return [by_id[payload["id"]] for payload in payloads]
+
+    def call_many(self, calls, first=0):
+        """
+        Make several calls in one JSON-RPC batch request.
+        If the M720 rejects batches, the calls are made concurrently on the open connections
+        (at most `workers` at the same time).
+        :param calls: list of (ubus object, method, params)
+        :param first: number of the first calls made one by one before the others if the M720
+        rejects batches (the others depend on them), a batch is processed in order
+        :return: list of JSON-RPC replies in the order of the calls
+        """
+        if not calls:
+            return []
+        if self.batch_supported is not False:
+            token = self.token
+            replies = self._batch(token, calls)
+            if replies is not None and any(map(self.is_access_denied, replies)):
+                with self._lock:
+                    if self._token == token:
+                        self._token = None
+                replies = self._batch(self.token, calls)
+            if replies is not None and not all(
+                    reply.get("error", {}).get("code") == self.INVALID_REQUEST_ERROR
+                    for reply in replies):
+                self.batch_supported = True
+                denied = [call for call, reply in zip(calls, replies)
+                          if self.is_access_denied(reply)]
+                if denied:
+                    raise AccessDenied(f"Access denied to {denied[0][0]}.{denied[0][1]} "
+                                       f"on {self.ip_addr}")
+                self._touch()
+                return replies
+            self.batch_supported = False
+        replies = [self.call(*call) for call in calls[:first]]
+        rest = calls[first:]
+        if self.workers == 1 or len(rest) < 2:
+            replies.extend(self.call(*call) for call in rest)
+        else:
+            replies.extend(self._calls_executor().map(lambda call: self.call(*call), rest))
+        return replies
+
+    def _calls_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def close(self):
+        """
+        Save the session expiry and close the HTTP connections.
+        """
+        with self._lock:
+            self._write_cache()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 def connection(ip_addr):
-    login = "admin"  # change if you have another login
-    password = "PleaseChangeTheAdminPassword"  # change if you have another password
-    connection = requests.post(
-        f"http://{ip_addr}/api", json=
-        {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "call",
-            "params":
-                ["00000000000000000000000000000000", "session", "login",
-                 {
-                     "username": login, "password": password, "timeout": 300
-                 }
-                 ]
-        })
-    return connection.json()["result"][1]["ubus_rpc_session"]
-
-
-def configure_y1564(ip_addr, connection_id, y1564_params):
-    r = requests.post(f"http://{ip_addr}/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1, "method": "call",
-        "params":
-            [
-                connection_id, "y1564", "setprm",
-                {
-                    "ids": {
-                        "profile": PROFILE
+    """
+    :param ip_addr: M720 IP address
+    :return: M720Client, the cached ubus session is used if it is still valid
+    """
+    return M720Client(ip_addr)
+
+
+def y1564_setprm_call(y1564_params):
+    """
+    :param y1564_params: y1564_parameters
+    :return: setprm call of the Y.1564 test settings for M720Client.call_many
+    """
+    return "y1564", "setprm", {
+        "ids": {
+            "profile": PROFILE
+        },
+        "parameters": {
+            "y1564": {
+                "service_count": y1564_params['service_count'],
+                "step_count": y1564_params['step_count'],
+                "conf_duration": {
+                    "type": "useconds",
+                    "useconds": y1564_params['conf_duration_useconds'],
+                    "packets": y1564_params['conf_duration_packets'],
+                    "bytes": y1564_params['conf_duration_bytes'],
+                },
+                "perf_duration": {
+                    "type": "useconds",
+                    "useconds": y1564_params['perf_duration_useconds'],
+                    "packets": y1564_params['perf_duration_packets'],
+                    "bytes": y1564_params['perf_duration_bytes'],
+                },
+                "cir_enabled": y1564_params['cir_enabled'],
+                "eir_enabled": y1564_params['eir_enabled'],
+                "tp_enabled": y1564_params['tp_enabled'],
+                "perf_enabled": y1564_params['perf_enabled']
+            },
+            "trial": {
+                "ifaces": {
+                    "rx": {
+                        "name": y1564_params['topology_rx_port'],
+                        "disabled": not y1564_params['topology_rx_enabled']
                     },
-                    "parameters": {
-                        "y1564": {
-                            "service_count": y1564_params['service_count'],
-                            "step_count": y1564_params['step_count'],
-                            "conf_duration": {
-                                "type": "useconds",
-                                "useconds": y1564_params['conf_duration_useconds'],
-                                "packets": y1564_params['conf_duration_packets'],
-                                "bytes": y1564_params['conf_duration_bytes'],
-                            },
-                            "perf_duration": {
-                                "type": "useconds",
-                                "useconds": y1564_params['perf_duration_useconds'],
-                                "packets": y1564_params['perf_duration_packets'],
-                                "bytes": y1564_params['perf_duration_bytes'],
-                            },
-                            "cir_enabled": y1564_params['cir_enabled'],
-                            "eir_enabled": y1564_params['eir_enabled'],
-                            "tp_enabled": y1564_params['tp_enabled'],
-                            "perf_enabled": y1564_params['perf_enabled']
-                        },
-                        "trial": {
-                            "ifaces": {
-                                "rx": {
-                                    "name": y1564_params['topology_rx_port'],
-                                    "disabled": not y1564_params['topology_rx_enabled']
-                                },
-                                "tx": {
-                                    "name": y1564_params['topology_tx_port'],
-                                    "disabled": not y1564_params['topology_tx_enabled']
-                                }
-                            },
-                            "learn_time_ms": y1564_params['learn_time_ms']
-                        }
+                    "tx": {
+                        "name": y1564_params['topology_tx_port'],
+                        "disabled": not y1564_params['topology_tx_enabled']
                     }
-                }
-            ]
-    })
-    return r.json()
-
-
-def configure_y1564_service(ip_addr, connection_id, service_params):
-    r = requests.post(f"http://{ip_addr}/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1, "method": "call",
-        "params":
-            [
-                connection_id, "y1564", "setprm",
-                {
-                    "ids": {
-                        "profile": PROFILE,
-                        "service": service_params['service_number']
-                    },
-                    "parameters": {
-                        "frame_size": service_params['frame_size'],
-                        "header": {
-                            "src": {
-                                "mac": service_params['src_mac'],
-                                "ip": service_params['src_ip'],
-                                "udp_port": service_params['src_udp_port']
-                            },
-                            "dst": {
-                                "mac": service_params['dst_mac'],
-                                "ip": service_params['dst_ip'],
-                                "udp_port": service_params['dst_udp_port']
-                            },
-                            "vlan": {
-                                "count": service_params['vlan_count'],
-                                "tags": [
-                                    {
-                                        "pri": service_params['vlan_pri1'],
-                                        "id": service_params['vlan_id1']
-                                    },
-                                    {
-                                        "pri": service_params['vlan_pri2'],
-                                        "id": service_params['vlan_id2']
-                                    },
-                                    {
-                                        "pri": service_params['vlan_pri3'],
-                                        "id": service_params['vlan_id3']
-                                    }
-                                ]},
-                            "mpls": {
-                                "count": service_params['mpls_count'],
-                                "labels": [{
-                                    "value": 128,
-                                    "tc": 0,
-                                    "ttl": 0},
-                                    {
-                                        "value": 128,
-                                        "tc": 0,
-                                        "ttl": 0
-                                    },
-                                    {
-                                        "value": 128,
-                                        "tc": 0,
-                                        "ttl": 0}
-                                ]},
-                            "qos_type": service_params['qos_type'],
-                            "dscp": service_params['service_dscp'],
-                            "tos": service_params['tos'],
-                            "precedence": service_params['precedence']
+                },
+                "learn_time_ms": y1564_params['learn_time_ms']
+            }
+        }
+    }
+
+
+def service_setprm_call(service_params):
+    """
+    :param service_params: service0_parameters - service3_parameters
+    :return: setprm call of the service settings for M720Client.call_many
+    """
+    return "y1564", "setprm", {
+        "ids": {
+            "profile": PROFILE,
+            "service": service_params['service_number']
+        },
+        "parameters": {
+            "frame_size": service_params['frame_size'],
+            "header": {
+                "src": {
+                    "mac": service_params['src_mac'],
+                    "ip": service_params['src_ip'],
+                    "udp_port": service_params['src_udp_port']
+                },
+                "dst": {
+                    "mac": service_params['dst_mac'],
+                    "ip": service_params['dst_ip'],
+                    "udp_port": service_params['dst_udp_port']
+                },
+                "vlan": {
+                    "count": service_params['vlan_count'],
+                    "tags": [
+                        {
+                            "pri": service_params['vlan_pri1'],
+                            "id": service_params['vlan_id1']
                         },
-                        "sac": {
-                            "loss_percents": service_params['sac_loss_percents'],
-                            "frame_delay_ms": service_params['sac_frame_delay_ms'],
-                            "delay_variation_ms": service_params['sac_delay_variation_ms'],
-                            "mfactor_mbps": service_params['sac_mfactor_mbps'],
-                            "unordered_percents": service_params['unordered_percents']
+                        {
+                            "pri": service_params['vlan_pri2'],
+                            "id": service_params['vlan_id2']
                         },
-                        "bandwidth": {
-                            "cir_rate": {
-                                "value": service_params['cir_rate_value'],
-                                "units": service_params['cir_rate_units'],
-                                "layer": service_params['cir_rate_layer']},
-                            "eir_rate": {
-                                "value": service_params['eir_rate_value'],
-                                "units": service_params['eir_rate_units'],
-                                "layer": service_params['eir_rate_layer']},
-                            "tp_rate": {
-                                "value": service_params['tp_rate_value'],
-                                "units": service_params['tp_rate_units'],
-                                "layer": service_params['tp_rate_layer']}
+                        {
+                            "pri": service_params['vlan_pri3'],
+                            "id": service_params['vlan_id3']
                         }
-                    }
-                }
-            ]})
-    return r.json()
-
-
-def show_y1564_settings(ip_addr, connection_id):
-    r = requests.post(f"http://{ip_addr}:80/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": [connection_id, "y1564", "getprm",
-                   {
-                       "ids": {
-                           "profile": PROFILE,
-                       }
-                   }
-                   ]
-    }
-                      )
-    return r.json()
-
-
-def show_service_settings(ip_addr, connection_id, service=0):
-    r = requests.post(f"http://{ip_addr}:80/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": [connection_id, "y1564", "getprm",
-                   {
-                       "ids": {
-                           "profile": PROFILE,
-                           "service": service
-                       }
-                   }
-                   ]
+                    ]},
+                "mpls": {
+                    "count": service_params['mpls_count'],
+                    "labels": [{
+                        "value": 128,
+                        "tc": 0,
+                        "ttl": 0},
+                        {
+                            "value": 128,
+                            "tc": 0,
+                            "ttl": 0
+                        },
+                        {
+                            "value": 128,
+                            "tc": 0,
+                            "ttl": 0}
+                    ]},
+                "qos_type": service_params['qos_type'],
+                "dscp": service_params['service_dscp'],
+                "tos": service_params['tos'],
+                "precedence": service_params['precedence']
+            },
+            "sac": {
+                "loss_percents": service_params['sac_loss_percents'],
+                "frame_delay_ms": service_params['sac_frame_delay_ms'],
+                "delay_variation_ms": service_params['sac_delay_variation_ms'],
+                "mfactor_mbps": service_params['sac_mfactor_mbps'],
+                "unordered_percents": service_params['unordered_percents']
+            },
+            "bandwidth": {
+                "cir_rate": {
+                    "value": service_params['cir_rate_value'],
+                    "units": service_params['cir_rate_units'],
+                    "layer": service_params['cir_rate_layer']},
+                "eir_rate": {
+                    "value": service_params['eir_rate_value'],
+                    "units": service_params['eir_rate_units'],
+                    "layer": service_params['eir_rate_layer']},
+                "tp_rate": {
+                    "value": service_params['tp_rate_value'],
+                    "units": service_params['tp_rate_units'],
+                    "layer": service_params['tp_rate_layer']}
+            }
+        }
     }
-                      )
-    return r.json()
 
 
-def show_y1564_results(ip_addr, connection_id):
+def configure_y1564(client, y1564_params):
+    return client.call(*y1564_setprm_call(y1564_params))
+
+
+def configure_y1564_service(client, service_params):
+    return client.call(*service_setprm_call(service_params))
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _check_range(errors, where, params, key, low, high=None, kind=int):
+    # A missing parameter is reported by the setprm call check
+    if key not in params:
+        return
+    value = _number(params.get(key), kind)
+    if value is None or value < low or (high is not None and value > high):
+        limits = f"{low} - {high}" if high is not None else f">= {low}"
+        errors.append(f"{where}: {key} must be {limits}, not {params.get(key)!r}")
+
+
+def _check_choice(errors, where, params, key, choices):
+    if key in params and params[key] not in choices:
+        errors.append(f"{where}: {key} must be one of {choices}, not {params.get(key)!r}")
+
+
+def _check_service(errors, service_params):
+    where = f"service {service_params.get('service_number')}"
+    _check_range(errors, where, service_params, 'frame_size', 64)
+    for key in ('src_ip', 'dst_ip'):
+        try:
+            ipaddress.IPv4Address(service_params.get(key))
+        except ValueError:
+            errors.append(f"{where}: {key} is not an IPv4 address: {service_params.get(key)!r}")
+    for key in ('src_mac', 'dst_mac'):
+        if not re.fullmatch(r"[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}", str(service_params.get(key))):
+            errors.append(f"{where}: {key} is not a MAC address: {service_params.get(key)!r}")
+    for key in ('src_udp_port', 'dst_udp_port'):
+        _check_range(errors, where, service_params, key, 0, 65535)
+    _check_range(errors, where, service_params, 'vlan_count', 0, 3)
+    for tag in (1, 2, 3):
+        _check_range(errors, where, service_params, f'vlan_id{tag}', 0, 4095)
+        _check_range(errors, where, service_params, f'vlan_pri{tag}', 0, 7)
+    _check_range(errors, where, service_params, 'mpls_count', 0, 3)
+    for key in ('tos', 'precedence', 'service_dscp'):
+        _check_range(errors, where, service_params, key, 0)
+    for test in ('cir', 'eir', 'tp'):
+        _check_choice(errors, where, service_params, f'{test}_rate_units',
+                      ('percents', 'kbps', 'mbps'))
+        _check_range(errors, where, service_params, f'{test}_rate_layer', 1, 4)
+        high = 100 if service_params.get(f'{test}_rate_units') == 'percents' else None
+        _check_range(errors, where, service_params, f'{test}_rate_value', 0, high, float)
+    for key in ('sac_delay_variation_ms', 'sac_frame_delay_ms', 'sac_loss_percents',
+                'sac_mfactor_mbps', 'unordered_percents'):
+        _check_range(errors, where, service_params, key, 0, kind=float)
+    try:
+        service_setprm_call(service_params)
+    except KeyError as error:
+        errors.append(f"{where}: missing parameter {error}")
+
+
+def validate_profile(y1564_params, services_params):
+    """
+    Check the profile before anything is sent to the M720.
+    :param y1564_params: y1564_parameters
+    :param services_params: list of service parameters, e.g. services_parameters
+    :return: parameters of the services 0 - service_count-1 in the order of the numbers
+    :raise ValueError: with all errors of the profile
+    """
+    errors = []
+    _check_range(errors, "y1564", y1564_params, 'service_count', 1, 4)
+    _check_range(errors, "y1564", y1564_params, 'step_count', 1, 10)
+    _check_range(errors, "y1564", y1564_params, 'learn_time_ms', 0)
+    for key in ('topology_rx_port', 'topology_tx_port'):
+        _check_choice(errors, "y1564", y1564_params, key, ('porta', 'portb'))
+    tests = [test for test in ('cir', 'eir', 'tp', 'perf') if y1564_params.get(f'{test}_enabled')]
+    if not tests:
+        errors.append("y1564: no test is enabled")
+    # The durations are configured in useconds
+    if set(tests) & {'cir', 'eir', 'tp'}:
+        _check_range(errors, "y1564", y1564_params, 'conf_duration_useconds', 1)
+    if 'perf' in tests:
+        _check_range(errors, "y1564", y1564_params, 'perf_duration_useconds', 1)
+    try:
+        y1564_setprm_call(y1564_params)
+    except KeyError as error:
+        errors.append(f"y1564: missing parameter {error}")
+
+    by_number = {}
+    for service_params in services_params:
+        number = service_params.get('service_number')
+        if number in by_number:
+            errors.append(f"service {number}: defined twice")
+        by_number[number] = service_params
+    service_count = _number(y1564_params.get('service_count'), int) or 0
+    selected = []
+    for number in range(min(service_count, 4)):
+        if number not in by_number:
+            errors.append(f"service {number}: no parameters for service_count {service_count}")
+            continue
+        _check_service(errors, by_number[number])
+        selected.append(by_number[number])
+    if errors:
+        raise ValueError("\n".join(errors))
+    return selected
+
+
+def _call_ok(reply):
+    result = reply.get("result")
+    return "error" not in reply and isinstance(result, list) and result[:1] == [0]
+
+
+def apply_profile(client, y1564_params, services_params, start=True):
+    """
+    Configure the test and all its services with one batch of setprm calls,
+    then start the test.
+    :param client: M720Client
+    :param y1564_params: y1564_parameters
+    :param services_params: list of service parameters, e.g. services_parameters
+    :param start: start the test after the configuration
+    :return: reply of the start call, None if the test is not started
+    :raise ValueError: the profile is invalid, nothing is sent to the M720
+    :raise RuntimeError: the M720 rejected a setprm call (the test is not started)
+    or the start call
+    """
+    services = validate_profile(y1564_params, services_params)
+    calls = [y1564_setprm_call(y1564_params)]
+    calls.extend(service_setprm_call(service_params) for service_params in services)
+    # service_count of the y1564 setprm selects the services
+    replies = client.call_many(calls, first=1)
+    names = ["y1564"] + [f"service {params['service_number']}" for params in services]
+    failed = [f"{name}: {reply}" for name, reply in zip(names, replies) if not _call_ok(reply)]
+    if failed:
+        raise RuntimeError(f"Configuration of {client.ip_addr} failed: {'; '.join(failed)}")
+    if not start:
+        return None
+    reply = start_y1564(client)
+    if not _call_ok(reply):
+        raise RuntimeError(f"Start of the test on {client.ip_addr} failed: {reply}")
+    return reply
+
+
+def show_y1564_settings(client):
+    return client.call("y1564", "getprm", {
+        "ids": {
+            "profile": PROFILE,
+        }
+    })
+
+
+def show_service_settings(client, service=0):
+    return client.call("y1564", "getprm", {
+        "ids": {
+            "profile": PROFILE,
+            "service": service
+        }
+    })
+
+
+def y1564_status_call(service=None, test=None, part=0):
+    """
+    :param service: service number, None - common status of the test
+    :param test: cir, eir, tp or perf
+    :param part: CIR step, 0 for the other tests
+    :return: getsts call for M720Client.call_many
+    """
+    ids = {"profile": PROFILE}
+    if service is not None:
+        ids.update({"test": test, "part": part, "service": service})
+    return "y1564", "getsts", {"ids": ids}
+
+
+def y1564_test_parts(y1564_params):
+    """
+    :param y1564_params: y1564_parameters
+    :return: list of (test, part) of the enabled tests
+    """
+    parts = []
+    if y1564_params['cir_enabled']:
+        parts.extend(("cir", part) for part in range(y1564_params['step_count']))
+    for test in ("eir", "tp", "perf"):
+        if y1564_params[f'{test}_enabled']:
+            parts.append((test, 0))
+    return parts
+
+
+def _statuses(reply):
+    try:
+        return reply['result'][1]['answer'][0]['statuses']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _flow(reply):
+    statuses = _statuses(reply)
+    return statuses['flows'][0] if statuses and statuses.get('flows') else None
+
+
+def get_y1564_results(client, y1564_params, services=None):
+    """
+    Read the common status and the statistics of all services, tests and parts
+    in one batch request.
+    :param client: M720Client
+    :param y1564_params: y1564_parameters
+    :param services: service numbers, all services of service_count by default
+    :return: {"statuses": common status, "services": {service: {(test, part): flow}}},
+    the flow is None if the M720 has no statistics of the part
+    """
+    if services is None:
+        services = range(y1564_params['service_count'])
+    parts = [(service, test, part) for service in services
+             for test, part in y1564_test_parts(y1564_params)]
+    replies = client.call_many(
+        [y1564_status_call()] + [y1564_status_call(*part) for part in parts])
+    results = {"statuses": _statuses(replies[0]), "services": {}}
+    for (service, test, part), reply in zip(parts, replies[1:]):
+        results["services"].setdefault(service, {})[(test, part)] = _flow(reply)
+    return results
+
+
+def format_y1564_results(output):
     template = """
     smart-sfp(admin)(config)# show y1564 results {}
     Status:        {}
@@ -451,21 +903,6 @@ def show_y1564_results(ip_addr, connection_id):
     Part           {}
 
     """
-    r = requests.post(f"http://{ip_addr}:80/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": [connection_id, "y1564", "getsts",
-                   {
-                       "ids": {
-                           "profile": PROFILE
-                       }
-                   }
-                   ]
-    }
-                      )
-    output = r.json()['result'][1]['answer'][0]['statuses']
     status = output['status']
     message = output['retmsg']
     start_time = time.strftime("%H:%M:%S", time.gmtime(int(output['sys_time']['start_us']) / 1000000))
@@ -476,8 +913,7 @@ def show_y1564_results(ip_addr, connection_id):
     return template.format(PROFILE, status, message, start_time, stop_time, elapsed_time, test, part)
 
 
-def show_service_tests_results(ip_addr, connection_id, service=0, test="cir", part=0):
-    template = ""
+def format_service_tests_results(test, part, output):
     template_empty = """
              IR(L2 mbps)  FTD(ms)  FDV(ms)  FLR(%)   OOP(%)   
     {}
@@ -491,138 +927,440 @@ def show_service_tests_results(ip_addr, connection_id, service=0, test="cir", pa
     rx_unordered_packets: {}
     tx_packets: {}
     """
-    if part > 0:
-        for part in range(0, part):
-            r = requests.post(f"http://{ip_addr}:80/api", json=
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "call",
-                "params": [connection_id, "y1564", "getsts",
-                           {
-                               "ids": {
-                                   "profile": PROFILE,
-                                   "test": test,
-                                   "part": part,
-                                   "service": service
-                               }}]})
-            output = r.json()['result'][1]['answer'][0]['statuses']['flows'][0]
-            rate_min = output['info_rate']['min_mbps']
-            rate_avg = output['info_rate']['average_mbps']
-            rate_max = output['info_rate']['max_mbps']
-            ftd_min = output['frame_delay']['min_ms']
-            ftd_avg = output['frame_delay']['average_ms']
-            ftd_max = output['frame_delay']['max_ms']
-            fdv_avg = output['delay_variation']['average_ms']
-            fdv_max = output['delay_variation']['max_ms']
-            flr = output['loss_percents']
-            oop = output['unordered_percents']
-            stats_rx = output['stat']['rx_pkts']
-            stats_rx_o = output['stat']['rx_unordered_pkts']
-            stats_tx = output['stat']['tx_pkts']
-            template = template + template_empty.format(
-                test, part, rate_min, ftd_min, rate_avg, ftd_avg, fdv_avg, flr,
-                oop, rate_max, ftd_max, fdv_max, stats_rx, stats_rx_o, stats_tx
-            )
-    else:
-        r = requests.post(f"http://{ip_addr}:80/api", json=
-        {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "call",
-            "params": [connection_id, "y1564", "getsts",
-                       {
-                           "ids": {
-                               "profile": PROFILE,
-                               "test": test,
-                               "service": service,
-                               "part": 0
-                           }}]})
-        output = r.json()['result'][1]['answer'][0]['statuses']['flows'][0]
-        rate_min = output['info_rate']['min_mbps']
-        rate_avg = output['info_rate']['average_mbps']
-        rate_max = output['info_rate']['max_mbps']
-        ftd_min = output['frame_delay']['min_ms']
-        ftd_avg = output['frame_delay']['average_ms']
-        ftd_max = output['frame_delay']['max_ms']
-        fdv_avg = output['delay_variation']['average_ms']
-        fdv_max = output['delay_variation']['max_ms']
-        flr = output['loss_percents']
-        oop = output['unordered_percents']
-        stats_rx = output['stat']['rx_pkts']
-        stats_rx_o = output['stat']['rx_unordered_pkts']
-        stats_tx = output['stat']['tx_pkts']
-        template = template + template_empty.format(
-            test, part, rate_min, ftd_min, rate_avg, ftd_avg, fdv_avg, flr,
-            oop, rate_max, ftd_max, fdv_max, stats_rx, stats_rx_o, stats_tx
-        )
+    if output is None:
+        return f"""
+    {test}
+    [{part}]
+        no results
+    """
+    rate_min = output['info_rate']['min_mbps']
+    rate_avg = output['info_rate']['average_mbps']
+    rate_max = output['info_rate']['max_mbps']
+    ftd_min = output['frame_delay']['min_ms']
+    ftd_avg = output['frame_delay']['average_ms']
+    ftd_max = output['frame_delay']['max_ms']
+    fdv_avg = output['delay_variation']['average_ms']
+    fdv_max = output['delay_variation']['max_ms']
+    flr = output['loss_percents']
+    oop = output['unordered_percents']
+    stats_rx = output['stat']['rx_pkts']
+    stats_rx_o = output['stat']['rx_unordered_pkts']
+    stats_tx = output['stat']['tx_pkts']
+    return template_empty.format(
+        test, part, rate_min, ftd_min, rate_avg, ftd_avg, fdv_avg, flr,
+        oop, rate_max, ftd_max, fdv_max, stats_rx, stats_rx_o, stats_tx
+    )
+
+
+def show_y1564_results(client):
+    return format_y1564_results(_statuses(client.call(*y1564_status_call())))
+
+
+def show_service_tests_results(client, service=0, test="cir", part=0):
+    # CIR test has a part for each step, the other tests have one part
+    parts = range(0, part) if part > 0 else [0]
+    replies = client.call_many([y1564_status_call(service, test, part) for part in parts])
+    template = ""
+    for part, reply in zip(parts, replies):
+        template = template + format_service_tests_results(test, part, _flow(reply))
+    return template
+
+
+def show_all_y1564_results(client, y1564_params):
+    """
+    :param client: M720Client
+    :param y1564_params: y1564_parameters
+    :return: common status and the results of all services read in one batch request
+    """
+    results = get_y1564_results(client, y1564_params)
+    template = format_y1564_results(results["statuses"])
+    for service, parts in results["services"].items():
+        template = template + f"""
+    service {service}
+    """
+        for (test, part), flow in parts.items():
+            template = template + format_service_tests_results(test, part, flow)
+    return template
+
+
+def start_y1564(client):
+    return client.call("y1564", "start", {
+        "ids": {
+            "profile": PROFILE
+        }})
+
+
+def stop_y1564(client):
+    return client.call("y1564", "stop", {
+        "ids": {
+            "profile": PROFILE
+        }})
+
+
+class Y1564Watcher:
+    """
+    Follows the running test by the cur_test/cur_part of the common status.
+    The next status is read soon before the expected end of the current part
+    (conf_duration_useconds of the CIR steps, EIR and TP, perf_duration_useconds of PERF)
+    and then every WATCH_FAST_POLL seconds until the part changes; the polling
+    interval grows again if the part takes longer than expected.
+    """
+
+    def __init__(self, y1564_params, services=None, fast=WATCH_FAST_POLL, slow=WATCH_SLOW_POLL):
+        """
+        :param y1564_params: y1564_parameters
+        :param services: service numbers, all services of service_count by default
+        :param fast: minimum status polling interval (s)
+        :param slow: maximum status polling interval (s)
+        """
+        self.parts = y1564_test_parts(y1564_params)
+        self.services = list(range(y1564_params['service_count']) if services is None else services)
+        self.fast = fast
+        self.slow = slow
+        conf = int(y1564_params['conf_duration_useconds']) / 1000000
+        perf = int(y1564_params['perf_duration_useconds']) / 1000000
+        # None - the part ends after a number of bytes or packets, its time is unknown
+        self.durations = {"cir": conf or None, "eir": conf or None, "tp": conf or None,
+                          "perf": perf or None}
+        self.results = {"statuses": None, "services": {service: {} for service in self.services}}
+        self.current = None
+        self.done = False
+        self._part_start = None
+        self._part_end = None
+        self._last_poll = None
+        self._next_index = 0
+        self._running_seen = False
+
+    def _index(self, current):
+        try:
+            return self.parts.index(current)
+        except ValueError:
+            return None
+
+    def _expected_end(self, index, statuses, now, first):
+        duration = self.durations.get(self.current[0])
+        if duration is None or index is None:
+            return None
+        if not first:
+            return self._part_start + duration
+        # The watch started during the part: its start is estimated from the elapsed time
+        durations = [self.durations.get(test) for test, _ in self.parts[:index]]
+        if None in durations:
+            return None
+        in_part = int(statuses['sys_time']['elapsed_us']) / 1000000 - sum(durations)
+        return now + duration - min(max(in_part, 0), duration)
+
+    def update(self, statuses):
+        """
+        :param statuses: common status of the test
+        :return: list of (test, part) finished since the previous status
+        """
+        now = time.monotonic()
+        self.results["statuses"] = statuses
+        current = (statuses['cur_test'], statuses['cur_part'])
+        index = self._index(current)
+        upto = self._next_index
+        if statuses['status']:
+            self._running_seen = True
+            if current != self.current:
+                first = self.current is None
+                self.current = current
+                # The part changed between the previous status and this one
+                self._part_start = now if first else (self._last_poll + now) / 2
+                self._part_end = self._expected_end(index, statuses, now, first)
+                if index is not None:
+                    upto = index
+        else:
+            self.done = True
+            if self._running_seen or int(statuses['sys_time']['stop_us']):
+                # Finished or stopped: the current part is the last one with results
+                upto = len(self.parts) if index is None else index + 1
+        self._last_poll = now
+        finished = self.parts[self._next_index:upto]
+        self._next_index = max(self._next_index, upto)
+        return finished
+
+    def next_delay(self):
+        """
+        :return: time to the next status (s)
+        """
+        now = time.monotonic()
+        if self._part_end is not None and self._part_end - now > self.fast:
+            remaining = self._part_end - now
+            return min(self.slow, max(self.fast, remaining / 2))
+        # The part should have ended: fast polling, slower and slower if it is late
+        late = now - (self._part_end if self._part_end is not None else self._part_start or now)
+        return min(self.slow, max(self.fast, late / 4))
+
+    def parts_calls(self, finished):
+        """
+        :param finished: (test, part) returned by update
+        :return: getsts calls of all services of the parts for M720Client.call_many
+        """
+        return [y1564_status_call(service, test, part)
+                for test, part in finished for service in self.services]
+
+    def add_results(self, finished, replies):
+        """
+        :param finished: (test, part) returned by update
+        :param replies: replies of parts_calls
+        :return: list of (test, part, {service: flow})
+        """
+        replies = iter(replies)
+        parts = []
+        for test, part in finished:
+            flows = {}
+            for service in self.services:
+                flows[service] = _flow(next(replies))
+                self.results["services"][service][(test, part)] = flows[service]
+            parts.append((test, part, flows))
+        return parts
+
+
+def format_part_results(test, part, flows):
+    """
+    :param flows: dictionary service -> flow of the part
+    :return: results of the part of all services
+    """
+    template = ""
+    for service, flow in flows.items():
+        template = template + f"""
+    service {service}""" + format_service_tests_results(test, part, flow)
     return template
 
 
-def start_y1564(ip_addr, connection_id):
-    r = requests.post(f"http://{ip_addr}:80/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": [connection_id, "y1564", "start",
-                   {
-                       "ids": {
-                           "profile": PROFILE
-                       }}]})
-    return r.json()
-
-
-def stop_y1564(ip_addr, connection_id):
-    r = requests.post(f"http://{ip_addr}:80/api", json=
-    {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": [connection_id, "y1564", "stop",
-                   {
-                       "ids": {
-                           "profile": PROFILE
-                       }}]})
-    return r.json()
+def watch_y1564(client, y1564_params, on_part=None, services=None,
+                fast=WATCH_FAST_POLL, slow=WATCH_SLOW_POLL):
+    """
+    Wait for the end of the running test, the results of each test part are read
+    as soon as the part is finished.
+    :param client: M720Client
+    :param y1564_params: y1564_parameters
+    :param on_part: function(test, part, {service: flow}) called for each finished part,
+    the results are printed by default
+    :param services: service numbers, all services of service_count by default
+    :param fast: minimum status polling interval (s)
+    :param slow: maximum status polling interval (s)
+    :return: results in the format of get_y1564_results
+    """
+    if on_part is None:
+        def on_part(test, part, flows):
+            print(format_part_results(test, part, flows))
+    watcher = Y1564Watcher(y1564_params, services, fast, slow)
+    while True:
+        finished = watcher.update(_statuses(client.call(*y1564_status_call())))
+        if finished:
+            replies = client.call_many(watcher.parts_calls(finished))
+            for test, part, flows in watcher.add_results(finished, replies):
+                on_part(test, part, flows)
+        if watcher.done:
+            return watcher.results
+        time.sleep(watcher.next_delay())
+
+
+class _Fleet:
+    """
+    Requests to several M720 from one asyncio loop, at most `concurrency` at the same time.
+    The blocking M720Client calls run in a thread pool. The clients make the calls of call_many
+    one by one if the M720 rejects batches, so one request is one HTTP request at a time.
+    """
+
+    def __init__(self, concurrency):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def request(self, function, *args):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(function, *args))
+
+    async def watch(self, client, y1564_params, fast, slow):
+        # Y1564Watcher polling without holding a thread while waiting
+        watcher = Y1564Watcher(y1564_params, fast=fast, slow=slow)
+        while True:
+            reply = await self.request(client.call, *y1564_status_call())
+            finished = watcher.update(_statuses(reply))
+            if finished:
+                replies = await self.request(client.call_many, watcher.parts_calls(finished))
+                watcher.add_results(finished, replies)
+            if watcher.done:
+                return watcher.results
+            await asyncio.sleep(watcher.next_delay())
+
+    async def device(self, ip_addr, action, y1564_params, services_params, fast, slow):
+        client = await self.request(functools.partial(M720Client, workers=1), ip_addr)
+        try:
+            if action in ("start", "run"):
+                await self.request(apply_profile, client, y1564_params, services_params)
+            elif action == "stop":
+                await self.request(stop_y1564, client)
+            if action in ("run", "watch"):
+                return await self.watch(client, y1564_params, fast, slow)
+            return await self.request(get_y1564_results, client, y1564_params)
+        finally:
+            await self.request(client.close)
+
+
+async def run_fleet(devices, action="show", y1564_params=None, services_params=None,
+                    concurrency=FLEET_CONCURRENCY, timeout=FLEET_TIMEOUT,
+                    fast=WATCH_FAST_POLL, slow=WATCH_SLOW_POLL):
+    """
+    Run the action on all M720 at the same time.
+    :param devices: M720 IP addresses
+    :param action: start - configure and start the test, stop, show - read the results,
+    watch - wait for the end of the running test and read the results,
+    run - configure, start and watch the test
+    :param y1564_params: y1564_parameters
+    :param services_params: list of service parameters, the first service_count services
+    are configured by start and run
+    :param concurrency: maximum number of requests in progress
+    :param timeout: maximum time of the action on one M720 (s)
+    :param fast: minimum status polling interval of the run and watch actions (s)
+    :param slow: maximum status polling interval of the run and watch actions (s)
+    :return: dictionary IP address -> {"ok": True, "results": get_y1564_results}
+    or {"ok": False, "error": error message}
+    :raise ValueError: start or run with an invalid profile, no M720 is configured
+    """
+    y1564_params = y1564_params or y1564_parameters
+    services_params = services_params if services_params is not None else services_parameters
+    if action in ("start", "run"):
+        validate_profile(y1564_params, services_params)
+    fleet = _Fleet(concurrency)
+
+    async def device(ip_addr):
+        start = time.monotonic()
+        try:
+            results = await asyncio.wait_for(
+                fleet.device(ip_addr, action, y1564_params, services_params, fast, slow),
+                timeout)
+            result = {"ok": True, "results": results}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"timeout {timeout} s"}
+        except Exception as error:  # one failed M720 must not stop the others
+            result = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+        result["elapsed"] = round(time.monotonic() - start, 3)
+        return ip_addr, result
+
+    try:
+        return dict(await asyncio.gather(*(device(ip_addr) for ip_addr in devices)))
+    finally:
+        fleet.executor.shutdown(wait=False)
+
+
+def read_devices(file_name):
+    """
+    :param file_name: file with one M720 IP address per line, # - comment
+    :return: list of IP addresses
+    """
+    with open(file_name, "r", encoding="UTF-8") as file:
+        lines = (line.split("#")[0].strip() for line in file)
+        return [line for line in lines if line]
+
+
+def fleet_summary(results):
+    """
+    :param results: result of run_fleet
+    :return: one line per M720
+    """
+    lines = []
+    for ip_addr, result in results.items():
+        if not result["ok"]:
+            lines.append(f"{ip_addr}: failed in {result['elapsed']} s - {result['error']}")
+            continue
+        statuses = result["results"]["statuses"] or {}
+        flows = [flow for parts in result["results"]["services"].values()
+                 for flow in parts.values()]
+        lines.append(f"{ip_addr}: status {statuses.get('status')}, test "
+                     f"{statuses.get('cur_test')} part {statuses.get('cur_part')}, "
+                     f"{sum(flow is not None for flow in flows)}/{len(flows)} parts with results, "
+                     f"{result['elapsed']} s")
+    return "\n".join(lines)
+
+
+def fleet_results_json(results):
+    """
+    :param results: result of run_fleet
+    :return: results with the (test, part) keys as "test[part]" strings for json.dump
+    """
+    converted = {}
+    for ip_addr, result in results.items():
+        result = dict(result)
+        if result["ok"]:
+            result["results"] = {
+                "statuses": result["results"]["statuses"],
+                "services": {service: {f"{test}[{part}]": flow for (test, part), flow in parts.items()}
+                             for service, parts in result["results"]["services"].items()}
+            }
+        converted[ip_addr] = result
+    return converted
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Connect to M720 using REST API. Configure, start and stop y1564 test on M720.')
-    parser.add_argument('action', help='Use start/stop/show commands')
+    parser.add_argument('action', help='Use start/stop/show/watch commands, run with --devices')
+    parser.add_argument('--watch', action='store_true',
+                        help='After start wait for the end of the test, the results of each '
+                             'test part are printed as soon as the part is finished')
+    parser.add_argument('--devices', help='File with the IP addresses of several M720, '
+                                          'the action is done on all of them at the same time')
+    parser.add_argument('--concurrency', type=int, default=FLEET_CONCURRENCY,
+                        help='Requests in progress at the same time (--devices)')
+    parser.add_argument('--timeout', type=float, default=FLEET_TIMEOUT,
+                        help='Maximum time of the action on one M720 in seconds (--devices)')
+    parser.add_argument('--json', help='Write the results of all M720 to the JSON file (--devices)')
     args = parser.parse_args()
 
-    if args.action == "start":
+    if args.devices:
+        if args.action not in ("start", "stop", "show", "watch", "run"):
+            parser.error("Invalid argument. Use start, stop, show, watch or run parameter.")
+        devices = read_devices(args.devices)
+        print(f"{args.action} on {len(devices)} M720")
+        try:
+            fleet_results = asyncio.run(run_fleet(devices, args.action,
+                                                  concurrency=args.concurrency,
+                                                  timeout=args.timeout))
+        except ValueError as error:
+            raise SystemExit(f"Invalid profile:\n{error}")
+        print(fleet_summary(fleet_results))
+        if args.json:
+            with open(args.json, "w", encoding="UTF-8") as file:
+                json.dump(fleet_results_json(fleet_results), file, indent=2)
+    elif args.action == "start":
+        try:
+            services = validate_profile(y1564_parameters, services_parameters)
+        except ValueError as error:
+            raise SystemExit(f"Invalid profile:\n{error}")
         print(f"Connect to {IP_ADDRESS}")
-        connection_json_id = connection(IP_ADDRESS)
-        print("Configure service 0 and y1564 test")
-        y1564_config = configure_y1564(IP_ADDRESS, connection_json_id, y1564_parameters)
-        service0_config = configure_y1564_service(IP_ADDRESS, connection_json_id, service0_parameters)
-        print("Start y1564 test")
-        start_y1564(IP_ADDRESS, connection_json_id)
-        result_common_y1564 = show_y1564_results(IP_ADDRESS, connection_json_id)
-        print(result_common_y1564)
+        with connection(IP_ADDRESS) as client:
+            numbers = ", ".join(str(params['service_number']) for params in services)
+            print(f"Configure service {numbers} and y1564 test")
+            print("Start y1564 test")
+            apply_profile(client, y1564_parameters, services)
+            result_common_y1564 = show_y1564_results(client)
+            print(result_common_y1564)
+            if args.watch:
+                print("Wait for the end of y1564 test")
+                watch_results = watch_y1564(client, y1564_parameters)
+                print(format_y1564_results(watch_results["statuses"]))
     elif args.action == "stop":
         print(f"Connect to {IP_ADDRESS}")
-        connection_json_id = connection(IP_ADDRESS)
-        print("Stop y1564 test")
-        stop_y1564(IP_ADDRESS, connection_json_id)
-        result_common_y1564 = show_y1564_results(IP_ADDRESS, connection_json_id)
+        with connection(IP_ADDRESS) as client:
+            print("Stop y1564 test")
+            stop_y1564(client)
+            result_common_y1564 = show_y1564_results(client)
         print(result_common_y1564)
     elif args.action == "show":
         print(f"Connect to {IP_ADDRESS}")
-        connection_json_id = connection(IP_ADDRESS)
-        print("Print y1564 test results")
-        result_common_y1564 = show_y1564_results(IP_ADDRESS, connection_json_id)
-        result_cir_service0 = show_service_tests_results(IP_ADDRESS, connection_json_id, service=0, test="cir",
-                                                         part=y1564_parameters['step_count'])
-        result_eir_service0 = show_service_tests_results(IP_ADDRESS, connection_json_id, service=0, test="eir")
-        result_tp_service0 = show_service_tests_results(IP_ADDRESS, connection_json_id, service=0, test="tp")
-        result_perf_service0 = show_service_tests_results(IP_ADDRESS, connection_json_id, service=0, test="perf")
-        print(
-            result_common_y1564 + result_cir_service0 + result_eir_service0 +
-            result_tp_service0 + result_perf_service0
-        )
+        with connection(IP_ADDRESS) as client:
+            print("Print y1564 test results")
+            result_y1564 = show_all_y1564_results(client, y1564_parameters)
+        print(result_y1564)
+    elif args.action == "watch":
+        print(f"Connect to {IP_ADDRESS}")
+        with connection(IP_ADDRESS) as client:
+            print("Wait for the end of y1564 test")
+            watch_results = watch_y1564(client, y1564_parameters)
+        print(format_y1564_results(watch_results["statuses"]))
     else:
-        print("Invalid argument. Use start, stop or show parameter.")
+        print("Invalid argument. Use start, stop, show or watch parameter.")